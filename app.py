@@ -1,59 +1,87 @@
-from flask import Flask, jsonify, render_template, request, redirect, session, flash, url_for
+from flask import Flask, Blueprint, current_app, jsonify, render_template, request, redirect, session, flash, url_for, g, make_response, send_from_directory, has_request_context, Response, stream_with_context, abort, before_render_template, template_rendered
+from werkzeug.local import LocalProxy
 import logging
-import markdown
 from functools import wraps
 import sqlite3
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from datetime import datetime
+from datetime import datetime, timezone
 import uuid
 import logging.handlers
+import queue
+import atexit
 import secrets
-import pytz  # For timezone support
 from config import config
+from db import SCHEMA_VERSION, ConnectionPool, make_preview, migrate
+from search import backfill_search_index, search_posts
+from shards import ShardRouter, add_stub_user, shard_path, split_user
+from content import MarkdownCache, PostRenderer
+from drafts import PatchError, apply_patches
+from revisions import diff_lines, list_revisions, load_revision, record_revision
+from export import EXPORT_FORMATS, iter_posts, parse_timestamp, slice_chunks
+from importer import import_posts, iter_upload
+from group_commit import GroupCommitWriter
+from forksafe import ForkSafe
+from metrics import InstrumentedConnection, Metrics
+import time
+from collections import deque
+from health import HealthCheck
+from maintenance import Maintenance
+from page_cache import PageCache
+from passwords import HasherBusy, PasswordHasher
+from compression import ContentCodec, train_dictionary
+import stats
+import assets
+import ratelimit_storage  # Registers the sqlite:// scheme used by RATELIMIT_STORAGE_URI
+import json
+import hashlib
+import random
+import mimetypes
+import click
 
-# Initialize Limiter before create_app so it can be used inside create_app
-limiter = Limiter(
-    key_func=get_remote_address,
-    storage_uri="memory://"
-)
+try:
+    import fcntl
+except ImportError:  # Windows: every worker checks the schema itself
+    fcntl = None
 
-# Create Flask application with configuration
-def create_app(config_name='production'):
-    app = Flask(__name__)
-    
-    # Load configuration
-    app.config.from_object(config[config_name])
-    
-    # Initialize extensions
-    limiter.init_app(app)
-    
-    return app
+# Initialize Limiter before create_app so it can be used inside create_app.
+# Storage and strategy come from RATELIMIT_* in config.py.
+limiter = Limiter(key_func=get_remote_address)
+
+# Every route and CLI command lives on this blueprint; create_app() builds an app around it
+bp = Blueprint('main', __name__, cli_group=None)
 
-app = create_app(os.environ.get('FLASK_ENV', 'production'))
 MAX_CHARS_PER_POST = 30000  # Example limit for post content length
+SHELF_PAGE_SIZE = 12  # Cards per shelf page (4 rows of 3)
+SEARCH_PAGE_SIZE = 20
+
+# Handlers are attached by create_app() (setup_logging)
+logger = logging.getLogger(__name__)
 
-# Security Configurations (cursor assisted rewrite)
-app.secret_key = secrets.token_hex(32)  # Generate a secure random key
-app.config.update(
-    SESSION_COOKIE_SECURE=os.environ.get('FLASK_ENV') == 'production',  # Only require HTTPS in production
-    SESSION_COOKIE_HTTPONLY=True,       # Prevent JavaScript access to session cookie
-    SESSION_COOKIE_SAMESITE='Lax',      # CSRF protection
-    PERMANENT_SESSION_LIFETIME=1800,     # Session timeout (30 minutes)
-    MAX_CONTENT_LENGTH=10 * 1024 * 1024 # Max content length (10MB)
-)
+# The current app's services (create_app() puts them in app.extensions)
+metrics = LocalProxy(lambda: current_app.extensions['metrics'])
+content_codec = LocalProxy(lambda: current_app.extensions['content_codec'])
+password_hasher = LocalProxy(lambda: current_app.extensions['password_hasher'])
+page_cache = LocalProxy(lambda: current_app.extensions['page_cache'])
+post_renderer = LocalProxy(lambda: current_app.extensions['post_renderer'])
 
 # Security Context for Logging
 class SecurityLoggingFilter(logging.Filter):
+    """Stamp records with the request's address, user and path.
+
+    Runs on the request thread (before the record is queued) and looks the
+    context up once per request, reusing it for every later record.
+    """
     def filter(self, record):
         try:
-            from flask import has_request_context, request
             if has_request_context():
-                record.remote_addr = request.remote_addr
-                record.user_id = session.get('user_id', 'No User')
-                record.url = request.path
+                context = g.get('_log_context')
+                if context is None:
+                    context = g._log_context = (
+                        request.remote_addr, session.get('user_id', 'No User'), request.path
+                    )
+                record.remote_addr, record.user_id, record.url = context
             else:
                 record.remote_addr = 'No Request Context'
                 record.user_id = 'No Request Context'
@@ -71,151 +99,497 @@ class RequestFilter(logging.Filter):
         '/static/', '/favicon.ico', '/health',  # Common static and utility paths
         '/__pycache__/', '.pyc', '.map'  # Development files
     }
-    
+
     SKIP_METHODS = {'OPTIONS', 'HEAD'}  # Skip non-essential HTTP methods
-    
+
     def filter(self, record):
         if not hasattr(record, 'url'):
             return True
-        
+
         # Skip static file requests and health checks
         if any(ext in record.url for ext in self.SKIP_PATHS):
             return False
-            
+
         # Skip non-essential HTTP methods
         if hasattr(record, 'method') and record.method in self.SKIP_METHODS:
             return False
-            
+
         return True
 
 class ISTFormatter(logging.Formatter):
     """Custom formatter that converts timestamps to IST"""
-    
+
+    IST = None  # Looked up on the first record, not at import
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._last_second = None
+        self._last_time = None
+
     def converter(self, timestamp):
-        ist = pytz.timezone('Asia/Kolkata')
-        dt = datetime.fromtimestamp(timestamp)
-        return dt.astimezone(ist)
-    
+        if ISTFormatter.IST is None:
+            import pytz  # For timezone support; only the log writer thread needs it
+            ISTFormatter.IST = pytz.timezone('Asia/Kolkata')
+        return datetime.fromtimestamp(timestamp, self.IST)
+
     def formatTime(self, record, datefmt=None):
-        dt = self.converter(record.created)
         if datefmt:
-            return dt.strftime(datefmt)
-        return dt.strftime('%Y-%m-%d %H:%M:%S %Z')
+            return self.converter(record.created).strftime(datefmt)
+        # Records arrive in bursts within the same second; reuse the string
+        second = int(record.created)
+        if second != self._last_second:
+            self._last_time = self.converter(second).strftime('%Y-%m-%d %H:%M:%S %Z')
+            self._last_second = second
+        return self._last_time
+
+class BoundedQueueHandler(ForkSafe, logging.handlers.QueueHandler):
+    """QueueHandler for a bounded queue that drops (or briefly blocks) when full.
+
+    The listener thread that writes records to targets starts with the
+    first record in each process, so an app built before gunicorn forks
+    (--preload) still gets a writer in every worker.
+    """
 
-# Update database path to use instance folder
-DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'flowrite.db')
+    def __init__(self, targets, maxsize, policy='drop', block_timeout=0.05):
+        super().__init__(None)
+        self.targets = targets
+        self.maxsize = maxsize
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
 
-# Ensure instance directory exists
-os.makedirs(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance'), exist_ok=True)
+    def _start(self):
+        # A fresh queue: the parent's, and whatever its lock was doing at fork, stay behind
+        self.queue = queue.Queue(maxsize=self.maxsize)
+        listener = logging.handlers.QueueListener(self.queue, *self.targets, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)  # Flush what is still queued on shutdown
+
+    def enqueue(self, record):
+        self._ensure_started()
+        try:
+            if self.policy == 'block':
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1  # Never stall a request on logging
 
 # Add this near the top of the file, after imports
 CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'content')
+content_cache = MarkdownCache(CONTENT_DIR)  # Rendered markdown pages, refreshed on mtime change
 
 # Update logging configuration for PythonAnywhere
-def setup_logging():
-    """Configure logging to write to instance directory"""
-    log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'logs')
+def setup_logging(app):
+    """Configure logging to write to instance directory.
+
+    Request threads only put records on a bounded queue; a QueueListener
+    thread does the formatting, file writes and midnight rotation.
+    """
+    log_dir = os.path.join(app.instance_path, 'logs')
     os.makedirs(log_dir, exist_ok=True)
-    
-    logger = logging.getLogger(__name__)
+
     logger.setLevel(logging.INFO)
-    
-    # File Handler for general logs
+
+    # File Handler for general logs (only ever called from the listener thread)
     file_handler = logging.handlers.TimedRotatingFileHandler(
         os.path.join(log_dir, 'app.log'),
         when='midnight',
         interval=1,
         backupCount=7,  # Keep only last 7 days of logs
-        encoding='utf-8'
+        encoding='utf-8',
+        delay=True,  # Opened by the first record written, not at startup
     )
     file_handler.setLevel(logging.INFO)
     file_format = ISTFormatter(
         '[%(asctime)s] %(levelname)s: %(message)s'
     )
     file_handler.setFormatter(file_format)
-    
+
+    queue_handler = BoundedQueueHandler(
+        [file_handler],
+        maxsize=app.config['LOG_QUEUE_SIZE'],
+        policy=app.config['LOG_QUEUE_POLICY'],
+    )
+    queue_handler.setLevel(logging.INFO)
+    queue_handler.addFilter(SecurityLoggingFilter())
+    queue_handler.addFilter(RequestFilter())
+
     # Clear any existing handlers
     logger.handlers.clear()
-    logger.addHandler(file_handler)
-    
+    logger.addHandler(queue_handler)
+    # Kept for /health's drop count, whatever else gets added to the logger
+    app.extensions['log_queue'] = queue_handler
+
     return logger
 
-# Initialize logger
-logger = setup_logging()
+def load_secret_key(app):
+    """SECRET_KEY from the config/environment, else one generated once and kept in instance/.
+
+    Every worker and every restart then signs sessions with the same key.
+    """
+    if app.config.get('SECRET_KEY'):
+        return app.config['SECRET_KEY']
+    path = os.path.join(app.instance_path, 'secret_key')
+    if not os.path.exists(path):
+        # Written under a temporary name and linked into place, so a worker
+        # starting alongside never reads a half-written (empty) key
+        tmp = f"{path}.{os.getpid()}"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            pass  # Another worker got there first; everyone uses its key
+        finally:
+            os.unlink(tmp)
+    with open(path) as f:
+        return f.read().strip()
+
+# Create Flask application with configuration
+def create_app(config_name=None):
+    """Build the app: config, services, logging and routes.
+
+    Nothing here opens a database connection or starts a thread, apart
+    from the schema check, which runs once per deploy (see ensure_schema);
+    pools and background threads start lazily in whichever process first
+    needs them, so the app can be built before gunicorn forks (--preload).
+    """
+    started = time.perf_counter()
+    app = Flask(__name__)
+
+    # Load configuration
+    config_name = config_name or os.environ.get('FLASK_ENV', 'production')
+    app.config.from_object(config[config_name])
+    os.makedirs(app.instance_path, exist_ok=True)
+
+    # Security Configurations (cursor assisted rewrite)
+    app.secret_key = load_secret_key(app)
+    app.config.update(
+        SESSION_COOKIE_SECURE=config_name == 'production',  # Only require HTTPS in production
+        SESSION_COOKIE_HTTPONLY=True,       # Prevent JavaScript access to session cookie
+        SESSION_COOKIE_SAMESITE='Lax',      # CSRF protection
+        PERMANENT_SESSION_LIFETIME=1800,     # Session timeout (30 minutes)
+        MAX_CONTENT_LENGTH=10 * 1024 * 1024 # Max content length (10MB)
+    )
+
+    # Initialize extensions
+    limiter.init_app(app)
+    database = app.config['DATABASE']
+
+    # Request, DB, template and login timings, summed across workers for /metrics
+    app.extensions['metrics'] = Metrics(
+        app.config['METRICS_DIR'],
+        flush_interval=app.config['METRICS_FLUSH_SECONDS'],
+    )
+
+    # Post bodies may be stored compressed; SQL reads them through post_text(content)
+    app.extensions['content_codec'] = ContentCodec(
+        database,
+        codec=app.config['CONTENT_COMPRESSION'],
+        min_chars=app.config['CONTENT_COMPRESSION_MIN_CHARS'],
+        level=app.config['CONTENT_COMPRESSION_LEVEL'],
+        metrics=app.extensions['metrics'],
+    )
+
+    # One connection pool per worker process (and database file), shared by all requests it serves
+    def make_pool(path):
+        return ConnectionPool(
+            path,
+            max_size=app.config['DB_POOL_SIZE'],
+            timeout=10,
+            pragmas=app.config['SQLITE_PRAGMAS'],
+            factory=InstrumentedConnection,  # Counts queries for /metrics
+            functions={'post_text': app.extensions['content_codec'].decompress},  # Used by search triggers and the post_body view
+        )
+    app.extensions['db_pool'] = make_pool(database)
+
+    # Optional: batch this worker's post saves into shared transactions
+    def make_writer(pool):
+        return GroupCommitWriter(
+            pool,
+            max_batch=app.config['GROUP_COMMIT_MAX_BATCH'],
+            max_delay=app.config['GROUP_COMMIT_MAX_DELAY_MS'] / 1000,
+            context=app.app_context,  # Saves compress through content_codec, like the request would
+        )
+    if app.config['GROUP_COMMIT']:
+        app.extensions['group_commit'] = make_writer(app.extensions['db_pool'])
+
+    # Login/sign-up hashing runs on a few bounded threads instead of request threads
+    app.extensions['password_hasher'] = PasswordHasher(
+        iterations=app.config['PASSWORD_HASH_ITERATIONS'],
+        threads=app.config['PASSWORD_HASH_THREADS'],
+        max_queue=app.config['PASSWORD_HASH_MAX_QUEUE'],
+        metrics=app.extensions['metrics'],
+    )
+
+    # Rendered shelf/post pages; optional, off unless PAGE_CACHE is set
+    app.extensions['page_cache'] = PageCache(
+        app.config['PAGE_CACHE_MAX_BYTES'] if app.config['PAGE_CACHE'] else 0
+    )
+
+    # Markdown posts and shelf previews, rendered once per distinct text (MARKDOWN_POSTS)
+    app.extensions['post_renderer'] = PostRenderer(
+        app.config['MARKDOWN_CACHE_MAX_BYTES'],
+        metrics=app.extensions['metrics'],
+    )
+
+    # Fingerprinted CSS/JS from static/dist/; templates link them with asset_url('app.css')
+    app.extensions['assets'] = assets.AssetManifest(app.root_path, reload=app.debug, logger=logger)
+    app.jinja_env.globals['asset_url'] = app.extensions['assets'].url
+
+    setup_logging(app)
+
+    # Checkpoints, ANALYZE and incremental vacuum; `flask --app app db-maintenance`
+    # or, with MAINTENANCE_SCHEDULER, a background thread in every worker
+    def make_maintenance(pool, path):
+        return Maintenance(
+            pool,
+            path,
+            logger,
+            wal_threshold=app.config['MAINTENANCE_WAL_THRESHOLD_BYTES'],
+            analyze_ratio=app.config['MAINTENANCE_ANALYZE_RATIO'],
+            vacuum_step=app.config['MAINTENANCE_VACUUM_STEP_PAGES'],
+            vacuum_max_steps=app.config['MAINTENANCE_VACUUM_MAX_STEPS'],
+            interval=app.config['MAINTENANCE_INTERVAL_SECONDS'],
+        )
+    app.extensions['maintenance'] = make_maintenance(app.extensions['db_pool'], database)
+
+    # This worker's most recent request durations, for the /health p99 check
+    app.extensions['health'] = HealthCheck(
+        app.extensions['db_pool'],
+        database,
+        os.path.dirname(database),
+        limiter=limiter,
+        latencies=deque(maxlen=app.config['HEALTH_LATENCY_SAMPLES']),
+        ttl=app.config['HEALTH_CACHE_SECONDS'],
+        db_slow_ms=app.config['HEALTH_DB_SLOW_MS'],
+        wal_max_bytes=app.config['HEALTH_WAL_MAX_BYTES'],
+        wal_max_lag=app.config['HEALTH_WAL_MAX_LAG'],
+        min_free_bytes=app.config['HEALTH_MIN_FREE_BYTES'],
+        p99_max_ms=app.config['HEALTH_P99_MAX_MS'],
+        maintenance=app.extensions['maintenance'],
+    )
+
+    # Optional: users' posts spread over SHARD_COUNT files, each with its own
+    # pool, writer and upkeep; DATABASE becomes the catalog of accounts
+    app.extensions['shards'] = ShardRouter(
+        database,
+        app.config['SHARD_COUNT'],
+        make_pool,
+        make_writer=make_writer if app.config['GROUP_COMMIT'] else None,
+        make_maintenance=make_maintenance,
+    )
+
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.after_request(record_request_metrics)
+    app.teardown_appcontext(release_db)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    app.register_blueprint(bp)
+
+    if app.config['SCHEMA_CHECK']:
+        ensure_schema(app)
+    app.extensions['startup_seconds'] = time.perf_counter() - started
+    return app
+
+def ensure_schema(app):
+    """Create or migrate the database, once per deploy rather than in every worker.
+
+    A stamp file next to the database records the schema version it was
+    last brought up to (and which file that was, and how many shard files
+    it had then); while it matches, this
+    costs one stat() and never opens the database. Workers starting
+    together wait on a lock so only one of them migrates.
+    """
+    database = app.config['DATABASE']
+    shard_count = app.config['SHARD_COUNT']
+    stamp_path = database + '.schema'
+    lock = None
+
+    def current_stamp():
+        try:
+            info = os.stat(database)
+        except FileNotFoundError:
+            return None
+        if not info.st_size:
+            return None  # Deleted and recreated empty (possibly on the same inode)
+        if not all(os.path.exists(shard_path(database, number)) for number in range(shard_count)):
+            return None
+        return f"{SCHEMA_VERSION} {info.st_dev}:{info.st_ino} {shard_count}"
+
+    def stamped():
+        try:
+            with open(stamp_path) as f:
+                return f.read().strip() == current_stamp()
+        except FileNotFoundError:
+            return False
+
+    if stamped():
+        return
+    os.makedirs(os.path.dirname(database), exist_ok=True)
+    if fcntl is not None:
+        lock = open(database + '.schema.lock', 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+    try:
+        if not stamped():  # Another worker may have just done it
+            with app.app_context():
+                init_db()
+            with open(stamp_path, 'w') as f:
+                f.write(current_stamp())
+    finally:
+        if lock is not None:
+            lock.close()
+        # Don't hand this process's connections down to forked workers
+        app.extensions['db_pool'].close()
+        app.extensions['shards'].close()
 
-@app.before_request
 def before_request():
+    g.request_started = time.perf_counter()
+    if current_app.config['MAINTENANCE_SCHEDULER']:
+        current_app.extensions['maintenance'].start()  # No-op once this worker's thread is running
+        for maintenance in current_app.extensions['shards'].maintenance:
+            maintenance.start()
+
     # Skip logging for static files and health checks
     if any(ext in request.path for ext in RequestFilter.SKIP_PATHS):
         return
-    
+
     # Only log significant requests (removed redundant GET logging)
-    if request.method not in ['GET', 'HEAD', 'OPTIONS']:  # Only log non-idempotent methods
+    # PATCH is draft autosave traffic, every couple of seconds per open editor
+    if request.method not in ['GET', 'HEAD', 'OPTIONS', 'PATCH']:  # Only log non-idempotent methods
         request.id = str(uuid.uuid4())
         logger.info(f"{request.method} {request.path}")  # Log only method and path
 
-@app.after_request
 def after_request(response):
     # Skip logging for static files and health checks
     if any(ext in request.path for ext in RequestFilter.SKIP_PATHS):
         return response
-    
+
     # Only log errors and significant operations
     # if response.status_code >= 400 or request.method not in ['GET', 'HEAD', 'OPTIONS']:
     #     # Only log essential information: status code, method, path for errors
     #     logger.info(
     #         f"{response.status_code} {request.method} {request.path}"
     #     )
-    
+
     # Add security headers
     response.headers['X-Content-Type-Options'] = 'nosniff'
     response.headers['X-Frame-Options'] = 'SAMEORIGIN'
     response.headers['X-XSS-Protection'] = '1; mode=block'
     response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
-    
+
     return response
 
 def get_db():
-    """Connect to the SQLite database, creating it if it doesn't exist, and enable WAL mode."""
-    conn = sqlite3.connect(DATABASE, timeout=10, isolation_level=None)
-    conn.row_factory = sqlite3.Row  # Enable dict-like access to rows
-    return conn
+    """Return the pooled connection for this app context, checking one out on first use.
+
+    This is the catalog (accounts) when SHARD_COUNT is set; posts and
+    everything hanging off them are read through user_db().
+    """
+    if 'db' not in g:
+        g.db = current_app.extensions['db_pool'].acquire()
+        g.db.reset_stats()
+    return g.db
+
+def user_shard(user_id):
+    """Shard number holding user_id's posts, or None for the main database."""
+    return current_app.extensions['shards'].lookup(user_id, get_db)
+
+def user_db(user_id=None):
+    """Connection to the database holding a user's posts (the logged-in user's by default)."""
+    shard = user_shard(session['user_id'] if user_id is None else user_id)
+    if shard is None:
+        return get_db()
+    connections = g.setdefault('shard_dbs', {})
+    if shard not in connections:
+        connections[shard] = current_app.extensions['shards'].pools[shard].acquire()
+        connections[shard].reset_stats()
+    return connections[shard]
+
+def _request_connections():
+    return [db for db in [g.get('db'), *g.get('shard_dbs', {}).values()] if db is not None]
+
+def record_request_metrics(response):
+    if request.path.startswith('/static/'):
+        return response
+    # Templated rule ("/posts/<int:post_id>"), so label values stay bounded
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    labels = {"route": route, "method": request.method}
+    metrics.inc('flowrite_requests_total', dict(labels, status=str(response.status_code)))
+    if response.status_code == 429:
+        metrics.inc('flowrite_ratelimit_rejections_total', {"route": route})
+
+    started = g.get('request_started')
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        metrics.observe('flowrite_request_duration_seconds', labels, elapsed)
+        if route not in ('/health', '/metrics'):
+            current_app.extensions['health'].latencies.append(elapsed)
+    connections = _request_connections()
+    if connections:
+        metrics.inc('flowrite_db_queries_total', {"route": route}, sum(db.query_count for db in connections))
+        metrics.observe('flowrite_request_db_seconds', {"route": route}, sum(db.query_time for db in connections))
+    return response
+
+def _template_started(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+def _template_finished(sender, template, context, **extra):
+    started = g.pop('template_started', None)
+    if started is not None:
+        metrics.observe('flowrite_template_render_seconds', {"template": template.name}, time.perf_counter() - started)
+
+def release_db(exception=None):
+    """Hand the app context's connections back to their pools."""
+    db = g.pop('db', None)
+    if db is not None:
+        current_app.extensions['db_pool'].release(db)
+    pools = current_app.extensions['shards'].pools
+    for shard, db in g.pop('shard_dbs', {}).items():
+        pools[shard].release(db)
 
 def init_db():
-    """Initialize the database using schema.sql."""
+    """Initialize the database, and any shard files, using schema.sql (inside an app context)."""
+    init_database(get_db())
+    for pool in current_app.extensions['shards'].pools:
+        db = pool.acquire()
+        try:
+            init_database(db)
+        finally:
+            pool.release(db)
+
+def init_database(db):
+    """Create or migrate one database file through connection db."""
     # Check if database already exists and has the required tables
     try:
-        with get_db() as db:
+        with db:
             tables = db.execute("""
-                SELECT name FROM sqlite_master 
+                SELECT name FROM sqlite_master
                 WHERE type='table' AND (name='user' OR name='post')
             """).fetchall()
             if len(tables) == 2:  # Both tables exist
-                return  # Database is already initialized
+                # Database is already initialized, bring an older file up to date
+                applied = migrate(db)
+                if applied:
+                    logger.info(f"Database migrated to schema version {applied[-1]}")
+                return
     except sqlite3.Error:
         pass  # Database doesn't exist or is corrupted, proceed with initialization
 
-    # Initialize the database
-    with app.app_context():
-        with get_db() as db:
-            schema_path = os.path.join(os.path.dirname(__file__), 'schema.sql')
-            try:
-                with open(schema_path, 'r') as f:
-                    db.executescript(f.read())
-                logger.info("Database schema initialized successfully")
-            except Exception as e:
-                logger.error(f"Failed to initialize database: {e}")
-                import sys
-                sys.exit(1)
-            
-            try:
-                # Enable WAL mode and foreign keys
-                db.execute('PRAGMA journal_mode=WAL;')
-                db.execute('PRAGMA foreign_keys=ON;')
-                logger.info("Database configuration completed successfully")
-            except Exception as e:
-                logger.error(f"Failed to configure database: {e}")
-                sys.exit(1)
+    # Initialize the database (WAL mode and foreign keys come from the pool's PRAGMAs)
+    with db:
+        schema_path = os.path.join(os.path.dirname(__file__), 'schema.sql')
+        try:
+            with open(schema_path, 'r') as f:
+                db.executescript(f.read())
+            logger.info("Database schema initialized successfully")
+        except Exception as e:
+            logger.error(f"Failed to initialize database: {e}")
+            import sys
+            sys.exit(1)
 
 # Middleware to check if user is logged in
 def login_required(f):
@@ -225,45 +599,313 @@ def login_required(f):
         if 'user_id' not in session:
             logger.warning(f"Unauthenticated session: {session.get('user_id', 'No User')} from {request.remote_addr} for {request.path}")
             flash('Please log in to access this page', 'warning')
-            return redirect(url_for('login', next=request.path))
+            return redirect(url_for('main.login', next=request.path))
         return f(*args, **kwargs)
     return decorated_function
 
-# Endpoint to check if the server is running
-@app.route('/health')
+# Same check for JSON endpoints, which can't follow a login redirect
+def api_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify({"error": "Login required"}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+def latest_draft(db, user_id, post_id=None):
+    """Most recently autosaved draft for a new post (post_id None) or an existing one."""
+    return db.execute(
+        """SELECT id, post_id, content, version FROM draft
+           WHERE user_id = ? AND post_id IS ?
+           ORDER BY updated_at DESC, id DESC LIMIT 1""",
+        (user_id, post_id)
+    ).fetchone()
+
+def discard_draft(db, user_id, draft_id):
+    """Drop the draft a just-saved form was built from, if it sent one."""
+    if draft_id is not None:
+        db.execute("DELETE FROM draft WHERE id = ? AND user_id = ?", (draft_id, user_id))
+
+def apply_draft_patch(db, user_id, draft_id, version, patches):
+    """Patch a draft if it is still at version. Returns (body, HTTP status).
+
+    Shared by PATCH /api/drafts/<id> and the live connection (live.py).
+    """
+    if not isinstance(version, int):
+        return {"error": "version is required"}, 400
+
+    draft = db.execute(
+        "SELECT content, version FROM draft WHERE id = ? AND user_id = ?",
+        (draft_id, user_id)
+    ).fetchone()
+    if not draft:
+        return {"error": "Draft not found"}, 404
+
+    if draft['version'] == version:
+        try:
+            content = apply_patches(draft['content'], patches)
+        except PatchError as e:
+            return {"error": str(e)}, 400
+        if len(content) > MAX_CHARS_PER_POST:
+            return {"error": "Content exceeds maximum length"}, 413
+
+        # Only lands if nobody else bumped the version since we read it
+        cursor = db.execute(
+            """UPDATE draft SET content = ?, version = version + 1, updated_at = CURRENT_TIMESTAMP
+               WHERE id = ? AND version = ?""",
+            (content, draft_id, version)
+        )
+        if cursor.rowcount == 1:
+            return {"version": version + 1}, 200
+        draft = db.execute("SELECT content, version FROM draft WHERE id = ?", (draft_id,)).fetchone()
+        if not draft:
+            return {"error": "Draft not found"}, 404
+
+    return {
+        "error": "Version conflict",
+        "version": draft['version'],
+        "content": draft['content'],
+    }, 409
+
+def run_write(fn, user_id=None):
+    """Run fn(db) in its own write transaction and return its result.
+
+    fn runs against user_id's database (see user_db()), or the main one.
+    With GROUP_COMMIT enabled the work is handed to that database's writer
+    thread and shares a transaction with whatever other saves are pending.
+    """
+    shard = None if user_id is None else user_shard(user_id)
+    if shard is None:
+        writer = current_app.extensions.get('group_commit')
+    else:
+        writers = current_app.extensions['shards'].writers
+        writer = writers[shard] if writers else None
+    if writer is not None:
+        return writer.submit(fn)
+
+    db = get_db() if user_id is None else user_db(user_id)
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        result = fn(db)
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    return result
+
+def insert_post(db, user_id, content, ip_address, draft_id=None):
+    """Add a post (and drop the draft it was written in). Returns the new post id."""
+    post = db.execute(
+        """INSERT INTO post (user_id, content, preview, created_at, ip_address) VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?)
+           RETURNING id, date(created_at) AS day""",
+        (user_id, content_codec.compress(content), make_preview(content), ip_address)
+    ).fetchone()
+    stats.record_change(db, user_id, post['day'], posts=1, words=stats.word_count(content))
+    discard_draft(db, user_id, draft_id)
+    return post['id']
+
+def apply_post_edit(db, post_id, content, user_id, draft_id=None):
+    """Overwrite a post's content, keeping the previous text in its revision history."""
+    post = db.execute(
+        "SELECT user_id, date(created_at) AS day, post_text(content) AS content FROM post WHERE id = ?", (post_id,)
+    ).fetchone()
+    old = post['content'] or ''
+    if old != content:
+        record_revision(db, post_id, old, content)
+        stats.record_change(db, post['user_id'], post['day'], words=stats.word_count(content) - stats.word_count(old))
+        # Rewriting the body also (de)compresses it under the current settings
+        db.execute(
+            """UPDATE post SET content = ?, preview = ?, rendered_html = NULL, updated_at = CURRENT_TIMESTAMP
+               WHERE id = ?""",
+            (content_codec.compress(content), make_preview(content), post_id)
+        )
+    discard_draft(db, user_id, draft_id)
+
+def remove_post(db, post_id):
+    """Delete a post, taking its words back out of the owner's stats."""
+    post = db.execute(
+        "DELETE FROM post WHERE id = ? RETURNING user_id, date(created_at) AS day, post_text(content) AS content",
+        (post_id,)
+    ).fetchone()
+    if post is not None:
+        stats.record_change(db, post['user_id'], post['day'], posts=-1, words=-stats.word_count(post['content']))
+
+def update_post_content(post_id, content, user_id, draft_id=None):
+    run_write(lambda db: apply_post_edit(db, post_id, content, user_id, draft_id), user_id)
+    page_cache.invalidate_user(user_id)
+
+# Every post column, with the body decompressed
+POST_COLUMNS = "id, user_id, post_text(content) AS content, created_at, ip_address, updated_at, preview"
+
+def post_markdown(post):
+    """Sanitized HTML for a post row read with POST_COLUMNS plus its raw content and rendered_html.
+
+    Comes from this worker's LRU, else the rendered_html column, else a
+    fresh render that is written back for every other worker. The write
+    only lands if the post still holds the text that was rendered.
+    """
+    key = post_renderer.key(post['content'])
+    html = post_renderer.get(key)
+    if html is not None:
+        return html
+    if post['rendered_html'] is not None:
+        html = content_codec.decompress(post['rendered_html'])
+    else:
+        html = post_renderer.convert(post['content'])
+        stored = content_codec.compress(html)
+        try:
+            run_write(lambda db: db.execute(
+                "UPDATE post SET rendered_html = ? WHERE id = ? AND content IS ? AND rendered_html IS NULL",
+                (stored, post['id'], post['stored_content'])
+            ), post['user_id'])
+        except sqlite3.Error as e:
+            logger.warning(f"Could not store rendered post {post['id']}: {e}")  # Rendered again next time
+    post_renderer.put(key, html)
+    return html
+
+def owned_post(db, post_id, columns='*'):
+    """Fetch a post only if it belongs to the logged-in user."""
+    post = db.execute(f"SELECT {columns}, user_id FROM post WHERE id = ?", (post_id,)).fetchone()
+    if post is None or post['user_id'] != session.get('user_id'):
+        return None
+    return post
+
+# Readiness probe: "ok" and "degraded" answer 200 (503 for "degraded" too with
+# ?strict=1, for balancers that should drain a struggling worker), "fail" 503
+@bp.route('/health')
+@limiter.exempt
 def health():
-    # TODO: add checks: database connection, external service availability
-    logger.info("Health check endpoint called")
-    return jsonify({"status": "OK"})
+    report = current_app.extensions['health'].run()
+    unhealthy = report['status'] == 'fail' or (report['status'] == 'degraded' and request.args.get('strict') == '1')
+    response = jsonify(dict(
+        report,
+        db_pool=current_app.extensions['db_pool'].stats(),
+        log_dropped=current_app.extensions['log_queue'].dropped,
+        group_commit=current_app.extensions['group_commit'].stats() if 'group_commit' in current_app.extensions else None,
+        page_cache=page_cache.stats(),
+        post_renderer=post_renderer.stats(),
+        password_hasher=password_hasher.stats(),
+    ))
+    response.status_code = 503 if unhealthy else 200
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@bp.route('/static/dist/<path:filename>')
+@limiter.exempt
+def dist_asset(filename):
+    """Serve a built asset, precompressed if the client takes it, cached for a year."""
+    if filename == assets.MANIFEST:
+        abort(404)
+    dist = os.path.join(current_app.root_path, assets.DIST_DIR)
+    path, encoding = assets.negotiate(dist, filename, request.headers.get('Accept-Encoding', ''))
+    # Names change whenever the contents do, so nothing needs revalidating
+    response = send_from_directory(dist, path, mimetype=mimetypes.guess_type(filename)[0],
+                                   max_age=current_app.config['ASSETS_MAX_AGE'], conditional=True)
+    response.cache_control.immutable = True
+    response.cache_control.public = True
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+@bp.route('/metrics')
+@limiter.exempt
+def metrics_endpoint():
+    # Prometheus scrape target; protected by a bearer token when METRICS_TOKEN is set
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        abort(401)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+_template_digests = {}
+
+def template_digest(*names):
+    """Hash of template sources, so ETags change when a deploy changes the page."""
+    digest = _template_digests.get(names)
+    if digest is None:
+        sha = hashlib.sha256()
+        for name in names:
+            source, _, _ = current_app.jinja_env.loader.get_source(current_app.jinja_env, name)
+            sha.update(source.encode('utf-8'))
+        digest = _template_digests[names] = sha.hexdigest()[:16]
+    return digest
+
+def not_modified(etag, last_modified=None):
+    """Return a 304 response if the request's validators still match, else None."""
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        fresh = (last_modified is not None and request.if_modified_since is not None
+                 and request.if_modified_since >= last_modified)
+    if not fresh:
+        return None
+    response = make_response('', 304)
+    set_validators(response, etag, last_modified)
+    return response
+
+def set_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Pages vary with the login cookie, so only the browser may keep them
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
+def page_etag(*parts):
+    return hashlib.sha256(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32]
+
+def cached_page(etag, last_modified, render):
+    """304 if the browser's copy is current, else this worker's cached copy, else render().
+
+    render() may return a response instead of the page (e.g. a redirect
+    when the row went away after the validator query); it isn't cached.
+    """
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    user_id = session.get('user_id')
+    body = page_cache.get(user_id, request.full_path, etag)
+    if body is None:
+        page = render()
+        if not isinstance(page, str):
+            return page
+        body = page.encode('utf-8')
+        page_cache.put(user_id, request.full_path, etag, body)
+    return set_validators(make_response(body), etag, last_modified)
 
 # Endpoint for landing page
-@app.route('/')
+@bp.route('/')
 def index():
-    article_path = os.path.join(CONTENT_DIR, 'index_article.md')
+    data = {
+        "title": "Home",
+        "message": "Home Page for Flowrite",
+    }
     try:
-        with open(article_path, 'r', encoding='utf-8') as file:
-            index_article = file.read()
-        article_html = markdown.markdown(index_article)
-        return render_template('index.html', data = {
-            "title": "Home",
-            "message": "Home Page for Flowrite",
-        }, article_html=article_html)
+        article = content_cache.get('index_article.md')
     except FileNotFoundError:
-        logger.error(f"Could not find index article at {article_path}")
-        return render_template('index.html', data = {
-            "title": "Home",
-            "message": "Home Page for Flowrite",
-        }, article_html="Welcome to Flowrite!")
+        logger.error(f"Could not find index article at {os.path.join(CONTENT_DIR, 'index_article.md')}")
+        return render_template('index.html', data=data, article_html="Welcome to Flowrite!")
+
+    # The page greets logged-in users by name, so that is part of the validator
+    user_key = hashlib.sha256(str(session.get('username', '')).encode('utf-8')).hexdigest()[:16]
+    etag = f"{article.etag}-{template_digest('base.html', 'index.html')}-{user_key}"
+    cached = not_modified(etag, article.last_modified)
+    if cached is not None:
+        return cached
+
+    response = make_response(render_template('index.html', data=data, article_html=article.html))
+    return set_validators(response, etag, article.last_modified)
 
 # Endpoint to serve WRITE editor page
-@app.route('/write', methods=['GET', 'POST'])
+@bp.route('/write', methods=['GET', 'POST'])
 @limiter.limit("120 per hour")  # Prevent spam (cursor assisted)
 def write():
     if request.method == 'POST':
         # Check if user is logged in
         if 'user_id' not in session:
             logger.warning(f"Unauthenticated save attempt from {request.remote_addr}")
-            return redirect(url_for('login', next=request.url))
+            return redirect(url_for('main.login', next=request.url))
 
         content = request.form.get('content')
         user_id = session.get('user_id')
@@ -278,57 +920,235 @@ def write():
             flash('Content exceeds maximum length', 'error')
             return redirect('/write')
 
-        with get_db() as db:
-            try:
-                cursor = db.execute(
-                    "INSERT INTO post (user_id, content, created_at, ip_address) VALUES (?, ?, CURRENT_TIMESTAMP, ?)",
-                    (user_id, content, request.remote_addr)
-                )
-                post_id = cursor.lastrowid  # Get the autoincremented id of the new post
-                logger.info(f"Created post. postID: {post_id}  user: {session.get('username')}")
-                flash('Post saved successfully', 'success')
-                
-            except sqlite3.Error as e:
-                logger.error(f"Database error while saving post: {e}")
-                flash('Failed to save post. Please try again.', 'error')
-                return redirect('/write')
+        # Read everything from the request up front; the insert may run on the group-commit thread
+        draft_id = request.form.get('draft_id', type=int)
+        ip_address = request.remote_addr
+        try:
+            post_id = run_write(lambda db: insert_post(db, user_id, content, ip_address, draft_id), user_id)
+            page_cache.invalidate_user(user_id)
+            logger.info(f"Created post. postID: {post_id}  user: {session.get('username')}")
+            flash('Post saved successfully', 'success')
+            
+        except sqlite3.Error as e:
+            logger.error(f"Database error while saving post: {e}")
+            flash('Failed to save post. Please try again.', 'error')
+            return redirect('/write')
 
         return redirect('/shelf')
 
-    return render_template('write.html', data={"title": "Write"})
+    # Pick up where an autosaved (unpublished) draft left off
+    draft = None
+    if 'user_id' in session:
+        with user_db() as db:
+            draft = latest_draft(db, session['user_id'])
+
+    return render_template('write.html', data={"title": "Write"}, draft=draft)
 
-@app.route('/shelf')
+@bp.route('/shelf')
 @login_required
 def shelf():
-    # Fetch the user's saved articles from the database
+    # Fetch one page of the user's saved articles, newest first.
+    # Keyset pagination on (created_at, id) stays on idx_post_user_created and
+    # never touches the full post bodies.
     user_id = session.get('user_id')
-    with get_db() as db:
-        posts = db.execute(
-            "SELECT * FROM post WHERE user_id = ? ORDER BY created_at DESC LIMIT 10",
-            (user_id,)
-        ).fetchall()
-    
-    # Convert posts to a list of dictionaries for rendering
-    display_posts = []
-    for post in posts:
-        display_posts.append({
-            "id": post['id'],
-            "content": post['content'],
-            "created_at": post['created_at']
+    before = request.args.get('before')
+    before_id = request.args.get('before_id', type=int)
+
+    # Any save, edit or delete by this user bumps post_version (schema triggers)
+    with user_db() as db:
+        user = db.execute("SELECT post_version FROM user WHERE id = ?", (user_id,)).fetchone()
+    # The date too: the streak in the stats line lapses at midnight (UTC) without any edit
+    markdown_on = current_app.config['MARKDOWN_POSTS']
+    etag = page_etag(user_id, user['post_version'] if user else 0, request.full_path, markdown_on,
+                     f"{datetime.now(timezone.utc):%Y-%m-%d}", template_digest('base.html', 'shelf.html'))
+
+    def render():
+        with user_db() as db:
+            summary = None if before else stats.totals(db, user_id)
+            if before and before_id is not None:
+                posts = db.execute(
+                    """SELECT id, preview, created_at FROM post
+                       WHERE user_id = ? AND (created_at, id) < (?, ?)
+                       ORDER BY created_at DESC, id DESC LIMIT ?""",
+                    (user_id, before, before_id, SHELF_PAGE_SIZE + 1)
+                ).fetchall()
+            else:
+                posts = db.execute(
+                    """SELECT id, preview, created_at FROM post
+                       WHERE user_id = ?
+                       ORDER BY created_at DESC, id DESC LIMIT ?""",
+                    (user_id, SHELF_PAGE_SIZE + 1)
+                ).fetchall()
+
+        # One extra row tells us whether there is another page
+        has_more = len(posts) > SHELF_PAGE_SIZE
+        posts = posts[:SHELF_PAGE_SIZE]
+
+        # Convert posts to a list of dictionaries for rendering
+        display_posts = []
+        for post in posts:
+            display_posts.append({
+                "id": post['id'],
+                "preview": post['preview'],
+                # Previews are short and repeat across pages; the renderer's LRU keeps them
+                "preview_html": post_renderer.render(post['preview']) if markdown_on and post['preview'] else None,
+                "created_at": post['created_at']
+            })
+
+        next_url = None
+        if has_more:
+            last = display_posts[-1]
+            next_url = url_for('main.shelf', before=last['created_at'], before_id=last['id'])
+
+        return render_template('shelf.html', data = {
+            "title": "Shelf",
+            "posts": display_posts,
+            "next_url": next_url,
+            "stats": summary,
         })
 
-    return render_template('shelf.html', data = {
-        "title": "Shelf",
-        "posts": display_posts,
+    return cached_page(etag, None, render)
+
+@bp.route('/shelf/stats')
+@login_required
+def shelf_stats():
+    # Reads the user_stats row and a year of daily rows, never the posts themselves
+    with user_db() as db:
+        user_stats = stats.load(db, session.get('user_id'))
+    peak = max((month['words'] for month in user_stats['months']), default=0)
+    return render_template('stats.html', data={"title": "Stats", "stats": user_stats, "peak_words": peak})
+
+@bp.route('/api/stats')
+@api_login_required
+def stats_api():
+    with user_db() as db:
+        return jsonify(stats.load(db, session.get('user_id')))
+
+@bp.route('/shelf/search')
+@login_required
+def shelf_search():
+    # Full-text search over the user's own posts, best matches first
+    user_id = session.get('user_id')
+    q = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    results = []
+    if q:
+        with user_db() as db:
+            try:
+                results = search_posts(
+                    db, user_id, q,
+                    limit=SEARCH_PAGE_SIZE + 1,
+                    offset=(page - 1) * SEARCH_PAGE_SIZE
+                )
+            except sqlite3.Error as e:
+                logger.error(f"Search failed for user {user_id}: {e}")
+                flash('Search failed. Please try again.', 'error')
+
+    has_more = len(results) > SEARCH_PAGE_SIZE
+    return render_template('search.html', data={
+        "title": "Search",
+        "q": q,
+        "results": results[:SEARCH_PAGE_SIZE],
+        "prev_url": url_for('main.shelf_search', q=q, page=page - 1) if page > 1 else None,
+        "next_url": url_for('main.shelf_search', q=q, page=page + 1) if has_more else None,
     })
 
+@bp.route('/shelf/export')
+@login_required
+@limiter.limit("20 per hour")
+def export_shelf():
+    # Stream every post as a ZIP of markdown files or as NDJSON, batch by batch
+    user_id = session.get('user_id')
+    fmt = request.args.get('format', 'zip')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "Unknown export format"}), 400
+    make_chunks, mimetype = EXPORT_FORMATS[fmt]
+
+    # Any save, edit or delete bumps post_version, and with it the archive bytes.
+    # No Last-Modified: timestamps can't tell same-second edits (or deletes) apart.
+    with user_db() as db:
+        user = db.execute("SELECT post_version FROM user WHERE id = ?", (user_id,)).fetchone()
+    etag = page_etag('export', fmt, user_id, user['post_version'] if user else 0)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    def generate():
+        return make_chunks(iter_posts(user_db(user_id), user_id))
+
+    byte_range = request.range
+    if_range = request.if_range
+    range_valid = 'If-Range' not in request.headers or if_range.etag == etag
+
+    if byte_range and range_valid:
+        # Resuming: the archive is deterministic, so a counting pass gives its length
+        length = sum(len(chunk) for chunk in generate())
+        bounds = byte_range.range_for_length(length)
+        if bounds is None:
+            response = make_response('', 416)
+            response.content_range = f"bytes */{length}"
+            return response
+        start, stop = bounds
+        response = Response(stream_with_context(slice_chunks(generate(), start, stop)), 206, mimetype=mimetype)
+        response.content_range = f"bytes {start}-{stop - 1}/{length}"
+        response.content_length = stop - start
+    else:
+        response = Response(stream_with_context(generate()), mimetype=mimetype)
+
+    filename = f"flowrite-shelf-{datetime.now():%Y%m%d}.{fmt}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.accept_ranges = 'bytes'
+    return set_validators(response, etag)
+
+@bp.route('/shelf/import', methods=['GET', 'POST'])
+@login_required
+@limiter.limit("10 per hour", methods=['POST'])
+def import_shelf():
+    # Bulk-load .md/.txt files (or ZIPs of them) as posts, keeping their timestamps
+    if request.method == 'POST':
+        # Must be set before the form is parsed; uploads spool to temp files, not memory
+        request.max_content_length = current_app.config['IMPORT_MAX_CONTENT_LENGTH']
+        user_id = session.get('user_id')
+        files = [f for f in request.files.getlist('files') if f.filename]
+        if not files:
+            return render_template('import.html', data={"title": "Import", "error": "Choose some files to import"}), 400
+
+        try:
+            mtimes = json.loads(request.form.get('mtimes') or '[]')
+        except ValueError:
+            mtimes = []
+
+        with user_db() as db:
+            results = import_posts(
+                db, user_id, iter_upload(files, mtimes),
+                max_chars=MAX_CHARS_PER_POST, ip_address=request.remote_addr,
+                compress=content_codec.compress,
+            )
+
+        imported = sum(1 for result in results if result['status'] == 'imported')
+        if imported:
+            page_cache.invalidate_user(user_id)
+        logger.info(f"Imported {imported}/{len(results)} files. user: {session.get('username')}")
+        return render_template('import.html', data={
+            "title": "Import",
+            "results": results,
+            "imported": imported,
+        })
+
+    return render_template('import.html', data={"title": "Import"})
+
 # TODO: check if user is the owner of the post (DONE)
-@app.route('/posts/<int:post_id>')
+@bp.route('/posts/<int:post_id>')
 @login_required  
 def view_post(post_id):
-    # Get post from database
-    with get_db() as db:
-        post = db.execute("SELECT * FROM post WHERE id = ?", (post_id,)).fetchone()
+    # Validators first; the body is only read if the page has to be rendered
+    with user_db() as db:
+        post = db.execute(
+            """SELECT post.user_id, post.created_at, post.updated_at, user.post_version
+               FROM post JOIN user ON user.id = post.user_id WHERE post.id = ?""",
+            (post_id,)
+        ).fetchone()
     
     # Check if post exists
     if post is None:
@@ -339,16 +1159,32 @@ def view_post(post_id):
     if post['user_id'] != session.get('user_id'):
         flash('You do not have permission to view this post', 'error')
         return redirect('/shelf')
-    
-    return render_template('post.html', post=post)
+
+    # updated_at only has second resolution; post_version tells same-second edits apart
+    changed = post['updated_at'] or post['created_at']
+    markdown_on = current_app.config['MARKDOWN_POSTS']
+    etag = page_etag(post_id, changed, post['post_version'], markdown_on, template_digest('base.html', 'post.html'))
+
+    def render():
+        with user_db() as db:
+            post = db.execute(
+                f"SELECT {POST_COLUMNS}, content AS stored_content, rendered_html FROM post WHERE id = ?", (post_id,)
+            ).fetchone()
+        # Deleted since the validator query
+        if post is None:
+            flash('Post not found', 'error')
+            return redirect('/shelf')
+        return render_template('post.html', post=post, post_html=post_markdown(post) if markdown_on else None)
+
+    return cached_page(etag, parse_timestamp(changed), render)
 
 # TODO: check if user is the owner of the post (DONE)
-@app.route('/posts/<int:post_id>/edit', methods=['GET', 'POST'])
+@bp.route('/posts/<int:post_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_post(post_id):
     # Get post from database
-    with get_db() as db:
-        post = db.execute("SELECT * FROM post WHERE id = ?", (post_id,)).fetchone()
+    with user_db() as db:
+        post = db.execute(f"SELECT {POST_COLUMNS} FROM post WHERE id = ?", (post_id,)).fetchone()
     
         # Check if post exists
         if not post:
@@ -368,26 +1204,147 @@ def edit_post(post_id):
                 return render_template('write.html', post=post)
             
             # Update post in database
-            db.execute("UPDATE post SET content = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                      (content, post_id))
+            update_post_content(post_id, content, post['user_id'], request.form.get('draft_id', type=int))
             flash('Post updated successfully', 'success')
             logger.info(f"Updated post. postID: {post_id} by user: {session.get('username')}")
-            return redirect(url_for('view_post', post_id=post_id))
+            return redirect(url_for('main.view_post', post_id=post_id))
     
-    # GET request - show edit form
+        # GET request - show edit form, with any unsaved autosaved edits
+        draft = latest_draft(db, post['user_id'], post_id)
+
     return render_template('write.html', data={
         "title": "Edit Post",
         "message": "Edit your post..."
-    }, post=post)
+    }, post=post, draft=draft)
+
+@bp.route('/api/drafts', methods=['POST'])
+@api_login_required
+@limiter.limit("30 per minute")
+def create_draft():
+    """Start server-side autosave for a new post, or for edits to an existing one."""
+    user_id = session.get('user_id')
+    payload = request.get_json(silent=True) or {}
+    content = payload.get('content', '')
+    post_id = payload.get('post_id')
+
+    if not isinstance(content, str) or (post_id is not None and not isinstance(post_id, int)):
+        return jsonify({"error": "Invalid draft"}), 400
+    if len(content) > MAX_CHARS_PER_POST:
+        return jsonify({"error": "Content exceeds maximum length"}), 413
+
+    with user_db() as db:
+        if post_id is not None:
+            post = db.execute("SELECT user_id FROM post WHERE id = ?", (post_id,)).fetchone()
+            if not post or post['user_id'] != user_id:
+                return jsonify({"error": "Post not found"}), 404
+        cursor = db.execute(
+            "INSERT INTO draft (user_id, post_id, content) VALUES (?, ?, ?)",
+            (user_id, post_id, content)
+        )
+
+    return jsonify({"id": cursor.lastrowid, "version": 0}), 201
+
+@bp.route('/api/drafts/<int:draft_id>', methods=['GET'])
+@api_login_required
+def get_draft(draft_id):
+    with user_db() as db:
+        draft = db.execute(
+            "SELECT id, post_id, content, version FROM draft WHERE id = ? AND user_id = ?",
+            (draft_id, session.get('user_id'))
+        ).fetchone()
+    if not draft:
+        return jsonify({"error": "Draft not found"}), 404
+    return jsonify(dict(draft))
+
+@bp.route('/api/drafts/<int:draft_id>', methods=['PATCH'])
+@api_login_required
+@limiter.limit("120 per minute")  # Debounced autosave, a few per second at most
+def patch_draft(draft_id):
+    """Apply small text patches to a draft, if the client saw its current version.
+
+    Body: {"version": n, "patches": [{"start": i, "end": j, "text": "..."}]}.
+    A stale version gets 409 with the server's copy so the client can resync.
+    """
+    payload = request.get_json(silent=True) or {}
+    with user_db() as db:
+        body, status = apply_draft_patch(db, session.get('user_id'), draft_id, payload.get('version'),
+                                         payload.get('patches', []))
+    return jsonify(body), status
+
+@bp.route('/api/session', methods=['POST'])
+@api_login_required
+def renew_session():
+    """Restart the session timeout; the editor calls this while someone is still writing.
+
+    Any request re-signs the (permanent) session cookie; this one just says
+    how long the new one lasts.
+    """
+    return jsonify({"expires_in": int(current_app.permanent_session_lifetime.total_seconds())})
+
+@bp.route('/api/drafts/<int:draft_id>', methods=['DELETE'])
+@api_login_required
+def delete_draft(draft_id):
+    with user_db() as db:
+        db.execute("DELETE FROM draft WHERE id = ? AND user_id = ?", (draft_id, session.get('user_id')))
+    return '', 204
+
+@bp.route('/posts/<int:post_id>/history')
+@bp.route('/posts/<int:post_id>/revisions/<int:revision>/diff')
+@login_required
+def post_history(post_id, revision=None):
+    # List a post's revisions, optionally with one revision's diff against the one before it
+    with user_db() as db:
+        post = owned_post(db, post_id, columns='id, created_at')
+        if not post:
+            flash('Post not found', 'error')
+            return redirect('/shelf')
+
+        revisions = list_revisions(db, post_id)
+        diff = None
+        if revision is not None:
+            new = load_revision(db, post_id, revision)
+            if new is None:
+                flash('Revision not found', 'error')
+                return redirect(url_for('main.post_history', post_id=post_id))
+            old = load_revision(db, post_id, revision - 1) if revision > 1 else ''
+            diff = diff_lines(old, new, f"revision {revision - 1}", f"revision {revision}")
+
+    return render_template('history.html', data={
+        "title": "History",
+        "post": post,
+        "revisions": revisions,
+        "revision": revision,
+        "diff": diff,
+    })
+
+@bp.route('/posts/<int:post_id>/revisions/<int:revision>/restore', methods=['POST'])
+@login_required
+def restore_revision(post_id, revision):
+    with user_db() as db:
+        if not owned_post(db, post_id, columns='id'):
+            flash('Post not found', 'error')
+            return redirect('/shelf')
+
+        content = load_revision(db, post_id, revision)
+        if content is None:
+            flash('Revision not found', 'error')
+            return redirect(url_for('main.post_history', post_id=post_id))
+
+        # Restoring is itself an edit, so it lands as a new revision
+        update_post_content(post_id, content, session.get('user_id'))
+        logger.info(f"Restored post {post_id} to revision {revision} by user: {session.get('username')}")
+        flash('Post restored', 'success')
+
+    return redirect(url_for('main.view_post', post_id=post_id))
 
 # TODO: check if user is the owner of the post (DONE)
-@app.route('/posts/<int:post_id>/delete', methods=['POST'])
+@bp.route('/posts/<int:post_id>/delete', methods=['POST'])
 @login_required
 @limiter.limit("50 per minute")  # Prevent rapid deletion (cursor assisted)
 def delete_post(post_id):
     user_id = session.get('user_id')
     
-    with get_db() as db:
+    with user_db() as db:
         try:
             # First check if post exists and belongs to user
             post = db.execute(
@@ -409,7 +1366,8 @@ def delete_post(post_id):
                 return redirect('/shelf'), 403
             
             # If checks pass, delete the post
-            db.execute("DELETE FROM post WHERE id = ?", (post_id,))
+            run_write(lambda db: remove_post(db, post_id), user_id)
+            page_cache.invalidate_user(user_id)
             logger.info(f"Deleted post. postID: {post_id} by user: {session.get('username')}")
             flash('Post deleted successfully', 'success')
             
@@ -419,7 +1377,24 @@ def delete_post(post_id):
     
     return redirect('/shelf')
 
-@app.route('/register', methods=['GET', 'POST'])
+def add_user_rows(db, user_id, username):
+    """Give a new account its shard (if sharded) and an empty stats row where its posts will live."""
+    shards = current_app.extensions['shards']
+    if shards.count:
+        shard = shards.assign(user_id)
+        db.execute("UPDATE user SET shard = ? WHERE id = ?", (shard, user_id))
+        shards.remember(user_id, shard)
+        add_stub_user(user_db(user_id), user_id, username)
+    user_db(user_id).execute("INSERT INTO user_stats (user_id) VALUES (?)", (user_id,))
+
+def busy_response(template):
+    response = make_response(render_template(template, data={
+        "error": "We're handling a lot of sign-ins right now. Please try again in a few seconds."
+    }), 503)
+    response.headers['Retry-After'] = '5'
+    return response
+
+@bp.route('/register', methods=['GET', 'POST'])
 @limiter.limit("50 per hour")  # Strict limit on registration attempts
 def register():
     if request.method == 'POST':
@@ -445,13 +1420,22 @@ def register():
                     return render_template('register.html', data={"error": "Username already exists"}), 400
                 
                 # Hash the password with strong parameters
-                hashed_password = generate_password_hash(password, method='pbkdf2')
+                try:
+                    hashed_password = password_hasher.hash(password)
+                except HasherBusy:
+                    logger.warning(f"Registration refused, password hashing saturated. userIP: {request.remote_addr}")
+                    return busy_response('register.html')
                 
                 # Insert user with creation timestamp
-                db.execute(
+                cursor = db.execute(
                     "INSERT INTO user (username, password, created_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
                     (username, hashed_password)
                 )
+                try:
+                    add_user_rows(db, cursor.lastrowid, username)
+                except sqlite3.Error:
+                    db.execute("DELETE FROM user WHERE id = ?", (cursor.lastrowid,))  # Free the name to try again
+                    raise
                 logger.info(f"New user registered: user: '{username}' userIP: {request.remote_addr}")
                 
             except sqlite3.Error as e:
@@ -461,7 +1445,7 @@ def register():
         return redirect('/login')
     return render_template('register.html', data={"title": "Register"})
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 @limiter.limit("60 per minute")  # Prevent brute force attempts
 def login():
     if request.method == 'POST':
@@ -478,7 +1462,15 @@ def login():
             try:
                 user = db.execute("SELECT * FROM user WHERE username = ?", (username,)).fetchone()
 
-                if not user or not check_password_hash(user['password'], password):
+                hash_started = time.perf_counter()
+                try:
+                    password_ok = bool(user) and password_hasher.verify(user['password'], password)
+                except HasherBusy:
+                    logger.warning(f"Login refused, password hashing saturated. userIP: {request.remote_addr}")
+                    return busy_response('login.html')
+                metrics.observe('flowrite_password_check_seconds', {}, time.perf_counter() - hash_started)
+
+                if not password_ok:
                     logger.warning(
                         f"Failed login attempt for user '{username}' from {request.remote_addr}",
                         extra={'attempt_type': 'invalid_credentials'}
@@ -497,6 +1489,15 @@ def login():
                     "UPDATE user SET last_login = CURRENT_TIMESTAMP, last_login_ip = ? WHERE id = ?",
                     (request.remote_addr, user['id'])
                 )
+
+                # Bring the stored hash up (or down) to the configured cost while we have the password
+                if password_hasher.needs_rehash(user['password']):
+                    try:
+                        db.execute("UPDATE user SET password = ? WHERE id = ?",
+                                   (password_hasher.hash(password), user['id']))
+                        logger.info(f"Password hash upgraded. user: '{username}'")
+                    except HasherBusy:
+                        pass  # Try again at the next login
                 
                 logger.info(f"login OK. user: '{username}' userIP: '{request.remote_addr}'")
                 
@@ -509,7 +1510,7 @@ def login():
 
     return render_template('login.html', data={"title": "Login"})
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     """Log out the user by clearing the session."""
     username = session.get('username', 'Unknown User')
@@ -517,7 +1518,220 @@ def logout():
     logger.info(f"logout OK, user: {username} userIP: {request.remote_addr}")
     return redirect('/')
 
+def each_database():
+    """(name, connection) for the main database, then each shard file; for CLI commands."""
+    yield 'main', get_db()
+    for number, pool in enumerate(current_app.extensions['shards'].pools):
+        db = pool.acquire()
+        try:
+            yield f"shard {number}", db
+        finally:
+            pool.release(db)
+
+@bp.cli.command('backfill-search')
+@click.option('--batch-size', default=500, show_default=True, help='Posts indexed per transaction.')
+def backfill_search_command(batch_size):
+    """Index posts that predate the full-text search table."""
+    init_db()
+    total = 0
+    for name, db in each_database():
+        done = 0
+        for done in backfill_search_index(db, batch_size=batch_size):
+            click.echo(f"Indexed {total + done} posts ({name})...")
+        total += done
+    logger.info(f"Search backfill complete: {total} posts indexed")
+    click.echo(f"Done. {total} posts indexed.")
+
+@bp.cli.command('rebuild-stats')
+@click.option('--batch-size', default=500, show_default=True, help='Posts read at a time.')
+def rebuild_stats_command(batch_size):
+    """Recompute every user's writing stats from their posts, one user per transaction."""
+    init_db()
+    users = posts = 0
+    for name, db in each_database():
+        # Users moved to a shard have a shard number here; their stats live there (shard NULL)
+        last_id = 0
+        while True:
+            row = db.execute(
+                "SELECT id FROM user WHERE id > ? AND shard IS NULL ORDER BY id LIMIT 1", (last_id,)
+            ).fetchone()
+            if row is None:
+                break
+            last_id = row['id']
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                posts += stats.rebuild_user(db, last_id, batch_size=batch_size)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            users += 1
+            if users % 100 == 0:
+                click.echo(f"Rebuilt stats for {users} users ({posts} posts, {name})...")
+    logger.info(f"Stats rebuild complete: {users} users, {posts} posts")
+    click.echo(f"Done. {users} users, {posts} posts.")
+
+@bp.cli.command('build-assets')
+@click.option('--fetch', is_flag=True, help='Download the pinned Bootstrap and Inter files into assets/vendor/ first.')
+def build_assets_command(fetch):
+    """Bundle, minify, fingerprint and precompress assets/ into static/dist/."""
+    if fetch:
+        try:
+            assets.fetch_vendor(current_app.root_path, log=click.echo)
+        except OSError as e:
+            raise click.ClickException(str(e))
+    manifest = assets.build(current_app.root_path, log=click.echo)
+    click.echo(f"Done. {len(manifest)} assets in {assets.DIST_DIR}/")
+    unbuilt = sorted(set(assets.FALLBACK_URLS) - set(manifest))
+    if unbuilt:
+        click.echo(f"Warning: {', '.join(unbuilt)} still load from the CDN; "
+                   "run with --fetch and commit assets/vendor/", err=True)
+
+@bp.cli.command('db-maintenance')
+@click.option('--force', is_flag=True, help='Checkpoint and ANALYZE even if below the thresholds.')
+@click.option('--vacuum', is_flag=True, help='Full VACUUM first; switches older databases to incremental auto_vacuum.')
+def db_maintenance_command(force, vacuum):
+    """Checkpoint the WAL, refresh planner statistics and reclaim free pages."""
+    init_db()
+    shards = current_app.extensions['shards']
+    for name, maintenance in [('main', current_app.extensions['maintenance']),
+                              *((f"shard {number}", m) for number, m in enumerate(shards.maintenance))]:
+        if shards.count:
+            click.echo(f"[{name}]")
+        if vacuum:
+            click.echo(f"VACUUM: {maintenance.vacuum_full()}")
+        for task, details in maintenance.run(force=force).items():
+            click.echo(f"{task}: {details}")
+
+@bp.cli.command('compress-posts')
+@click.option('--train', is_flag=True, help='Train and store a new shared dictionary from a sample of posts first.')
+@click.option('--sample', default=2000, show_default=True, help='Posts sampled for --train.')
+@click.option('--batch-size', default=200, show_default=True, help='Posts rewritten per transaction.')
+def compress_posts_command(train, sample, batch_size):
+    """Compress stored posts under CONTENT_COMPRESSION and report the savings."""
+    init_db()
+    codec = content_codec
+    if codec.codec is None:
+        raise click.UsageError("Set FLOWRITE_COMPRESSION to 'zlib' or 'zstd' first.")
+
+    if train:
+        samples = []
+        for _, db in each_database():
+            # Measured on the text: posts compressed by earlier runs are still good samples
+            samples += [row[0] for row in db.execute(
+                """SELECT body FROM (SELECT post_text(content) AS body FROM post)
+                   WHERE length(body) >= ? ORDER BY random() LIMIT ?""",
+                (codec.min_chars, sample)
+            )]
+        samples = random.sample(samples, min(sample, len(samples)))  # Shards sampled alike
+        if samples:
+            # Dictionaries live in the main database whichever file a post is in
+            get_db().execute("INSERT INTO content_dict (codec, data) VALUES (?, ?)",
+                             (codec.codec, train_dictionary(codec.codec, samples)))
+            codec.refresh()
+            click.echo(f"Trained a {codec.codec} dictionary from {len(samples)} posts")
+        else:
+            click.echo(f"No posts of {codec.min_chars} characters or more to train on; keeping the current dictionary")
+
+    raw_bytes = stored_bytes = rewritten = 0
+    started = time.perf_counter()
+    totals = {"posts": 0, "compressed": 0, "stored": 0, "raw": 0}
+    read_seconds = 0.0
+    for name, db in each_database():
+        # Plain posts above the threshold; rows left plain because they don't shrink are retried each run
+        last_id = 0
+        while True:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = db.execute(
+                    """SELECT id, content FROM post
+                       WHERE id > ? AND typeof(content) = 'text' AND length(content) >= ?
+                       ORDER BY id LIMIT ?""",
+                    (last_id, codec.min_chars, batch_size)
+                ).fetchall()
+                updates = []
+                for row in rows:
+                    stored = codec.compress(row['content'])
+                    if isinstance(stored, bytes):
+                        raw_bytes += len(row['content'].encode('utf-8'))
+                        stored_bytes += len(stored)
+                        updates.append((stored, row['id']))
+                db.executemany("UPDATE post SET content = ? WHERE id = ?", updates)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            if not rows:
+                break
+            rewritten += len(updates)
+            last_id = rows[-1]['id']
+            click.echo(f"Compressed {rewritten} posts ({name})...")
+
+        # Whole-table picture, timing a decompress of every compressed post
+        read_started = time.perf_counter()
+        row = db.execute(
+            """SELECT count(*) AS posts,
+                      sum(typeof(content) = 'blob') AS compressed,
+                      sum(length(CAST(content AS BLOB))) AS stored,
+                      sum(length(CAST(post_text(content) AS BLOB))) AS raw
+               FROM post"""
+        ).fetchone()
+        read_seconds += time.perf_counter() - read_started
+        for key in totals:
+            totals[key] += row[key] or 0
+    if rewritten:
+        click.echo(f"Compressed {rewritten} posts: {raw_bytes} -> {stored_bytes} bytes "
+                   f"({stored_bytes / raw_bytes:.1%}) in {time.perf_counter() - started:.1f}s")
+
+    if totals['posts']:
+        click.echo(f"{totals['compressed']}/{totals['posts']} posts compressed; bodies take "
+                   f"{totals['stored']} of {totals['raw']} bytes ({totals['stored'] / max(totals['raw'], 1):.1%}); "
+                   f"reading them all took {read_seconds * 1e6 / totals['posts']:.0f}us per post")
+        logger.info(f"compress-posts: {rewritten} rewritten, ratio {totals['stored'] / max(totals['raw'], 1):.3f}")
+
+@bp.cli.command('split-shards')
+def split_shards_command():
+    """Move each user's posts, drafts, history and stats into their shard file.
+
+    Run with FLOWRITE_SHARDS set and the app stopped. One user at a time,
+    so it can be interrupted and re-run; users already moved are skipped.
+    """
+    init_db()
+    shards = current_app.extensions['shards']
+    if not shards.count:
+        raise click.UsageError("Set FLOWRITE_SHARDS to the number of shard files first.")
+    catalog = get_db()
+    highest = catalog.execute("SELECT max(shard) FROM user").fetchone()[0]
+    if highest is not None and highest >= shards.count:
+        raise click.UsageError(f"Users are already on shard {highest}; FLOWRITE_SHARDS can grow but not shrink.")
+
+    users = posts = 0
+    last_id = 0
+    started = time.perf_counter()
+    while True:
+        user = catalog.execute(
+            "SELECT id, username, post_version FROM user WHERE id > ? AND shard IS NULL ORDER BY id LIMIT 1",
+            (last_id,)
+        ).fetchone()
+        if user is None:
+            break
+        last_id = user['id']
+        shard = shards.assign(user['id'])
+        pool = shards.pools[shard]
+        db = pool.acquire()
+        try:
+            posts += split_user(catalog, db, shard, user)
+        finally:
+            pool.release(db)
+        users += 1
+        if users % 100 == 0:
+            click.echo(f"Moved {users} users ({posts} posts)...")
+    logger.info(f"split-shards: {users} users, {posts} posts moved to {shards.count} shards")
+    click.echo(f"Done. {users} users and {posts} posts moved in {time.perf_counter() - started:.1f}s. "
+               f"Run `flask --app app db-maintenance --vacuum` to give the main database's space back.")
+
 if __name__ == '__main__':
     # Initialize DB to ensure schema exists
-    init_db()
+    with create_app().app_context():
+        init_db()
     print("Database initialized. Use PythonAnywhere's WSGI configuration to run the application.")
\ No newline at end of file
@@ -0,0 +1,262 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip variants are always built
+    brotli = None
+
+ASSETS_DIR = 'assets'
+DIST_DIR = os.path.join('static', 'dist')
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 10
+
+# Output name -> sources under assets/, concatenated in order
+BUNDLES = {
+    'vendor.css': ['vendor/bootstrap.min.css'],
+    'app.css': ['css/base.css', 'css/components.css', 'css/pages.css'],
+    'write.css': ['css/write.css'],
+    'inter.css': ['css/inter.css'],
+    'vendor.js': ['vendor/bootstrap.bundle.min.js'],
+    'app.js': ['js/base.js'],
+}
+# Copied as-is (only fingerprinted), for url("asset:<name>") references in CSS
+FILES = {
+    'inter.woff2': 'vendor/inter-latin-wght-normal.woff2',
+}
+# Vendor sources as published; `build-assets --fetch` downloads them into assets/vendor/
+VENDOR_URLS = {
+    'vendor/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css',
+    'vendor/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js',
+    'vendor/inter-latin-wght-normal.woff2':
+        'https://cdn.jsdelivr.net/npm/@fontsource-variable/inter@5.0.16/files/inter-latin-wght-normal.woff2',
+}
+# Where pages load a bundle from while it hasn't been built yet
+FALLBACK_URLS = {
+    'vendor.css': VENDOR_URLS['vendor/bootstrap.min.css'],
+    'vendor.js': VENDOR_URLS['vendor/bootstrap.bundle.min.js'],
+    'inter.css': 'https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap',
+}
+# Purged bundles keep only the rules whose class names appear in these files
+PURGE = {'vendor.css': ['templates', 'assets/js']}
+# Classes Bootstrap's JS adds at runtime, so they never appear in templates
+PURGE_SAFELIST = {
+    'show', 'showing', 'hide', 'fade', 'active', 'disabled', 'collapsing', 'collapsed',
+    'modal-open', 'modal-backdrop', 'modal-static', 'dropdown-backdrop', 'tooltip', 'popover',
+    'bs-tooltip-auto', 'bs-popover-auto', 'tooltip-arrow', 'tooltip-inner', 'was-validated',
+}
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json')
+
+
+def fetch_vendor(root, log=print):
+    """Download the pinned vendor files into assets/vendor/ (commit them afterwards)."""
+    import urllib.error  # Build-time only
+    import urllib.request
+    for source, url in VENDOR_URLS.items():
+        path = os.path.join(root, ASSETS_DIR, source)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                data = response.read()
+        except (urllib.error.URLError, OSError) as e:
+            raise OSError(f"Couldn't fetch {source} from {url}: {getattr(e, 'reason', e)}") from e
+        with open(path, 'wb') as f:
+            f.write(data)
+        log(f"Fetched {source} ({len(data)} bytes)")
+
+
+def minify_css(css):
+    css = re.sub(r'/\*(?!!).*?\*/', '', css, flags=re.S)  # Keeps /*! licence */ comments
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)  # Not before ':', where a space is a descendant combinator
+    return css.replace(';}', '}').strip()
+
+
+def _used_tokens(root, dirs):
+    tokens = set(PURGE_SAFELIST)
+    for directory in dirs:
+        for dirpath, _, filenames in os.walk(os.path.join(root, directory)):
+            for filename in filenames:
+                with open(os.path.join(dirpath, filename), encoding='utf-8', errors='ignore') as f:
+                    tokens.update(re.findall(r'[A-Za-z0-9_-]+', f.read()))
+    return tokens
+
+
+def _split_rules(css):
+    # Top-level blocks: "selector{...}" or "@media ...{rule{...}...}"
+    rules, depth, start = [], 0, 0
+    for i, char in enumerate(css):
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                rules.append(css[start:i + 1])
+                start = i + 1
+        elif char == ';' and depth == 0:
+            rules.append(css[start:i + 1])  # @charset/@import
+            start = i + 1
+    return rules
+
+
+def _classes(selector):
+    # Classes inside :not() make a rule match more elements, not fewer
+    return set(re.findall(r'\.([A-Za-z0-9_-]+)', re.sub(r':not\([^)]*\)', '', selector)))
+
+
+def purge_css(css, tokens):
+    """Drop rules none of whose selectors name only classes found in tokens."""
+    kept = []
+    for rule in _split_rules(css):
+        head, _, body = rule.partition('{')
+        if head.startswith('@media') or head.startswith('@supports'):
+            inner = purge_css(body[:-1], tokens)
+            if inner:
+                kept.append(head + '{' + inner + '}')
+        elif head.startswith('@'):
+            kept.append(rule)  # @font-face, @keyframes, :root-level at-rules
+        elif any(_classes(selector) <= tokens for selector in head.split(',')):
+            kept.append(rule)
+    return ''.join(kept)
+
+
+def _fingerprint(name, data):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+def _write(dist, name, data):
+    path = os.path.join(dist, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    written = [name]
+    if name.endswith(COMPRESSIBLE):
+        with open(path + '.gz', 'wb') as f:
+            # mtime=0 so rebuilding unchanged sources gives byte-identical files
+            with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=9, mtime=0) as gz:
+                gz.write(data)
+        written.append(name + '.gz')
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+            written.append(name + '.br')
+    return written
+
+
+def build(root, log=print):
+    """Bundle, minify, purge, fingerprint and precompress assets/ into static/dist/.
+
+    Bundles whose sources are missing (vendor files not fetched yet) are
+    skipped and keep loading from FALLBACK_URLS. Returns the manifest.
+    """
+    dist = os.path.join(root, DIST_DIR)
+    os.makedirs(dist, exist_ok=True)
+    manifest, outputs = {}, {MANIFEST}
+
+    # Plain files first so CSS can point at their fingerprinted names
+    for name, source in FILES.items():
+        path = os.path.join(root, ASSETS_DIR, source)
+        if not os.path.exists(path):
+            log(f"Skipped {name}: {source} missing")
+            continue
+        with open(path, 'rb') as f:
+            data = f.read()
+        manifest[name] = _fingerprint(name, data)
+        outputs.update(_write(dist, manifest[name], data))
+
+    for name, sources in BUNDLES.items():
+        paths = [os.path.join(root, ASSETS_DIR, source) for source in sources]
+        missing = [source for source, path in zip(sources, paths) if not os.path.exists(path)]
+        if missing:
+            log(f"Skipped {name}: {', '.join(missing)} missing" +
+                (" (served from the CDN until fetched)" if name in FALLBACK_URLS else ""))
+            continue
+        text = '\n'.join(open(path, encoding='utf-8').read() for path in paths)
+        size = len(text.encode('utf-8'))
+        if name.endswith('.css'):
+            text = minify_css(text)
+            if name in PURGE:
+                text = purge_css(text, _used_tokens(root, PURGE[name]))
+            unresolved = set()
+
+            def resolve(match):
+                target = manifest.get(match.group(1))
+                if target is None:
+                    unresolved.add(match.group(1))
+                    return match.group(0)
+                return f'url("{target}")'  # Relative: both live in static/dist/
+            text = re.sub(r'url\(["\']?asset:([^"\')]+)["\']?\)', resolve, text)
+            if unresolved:
+                log(f"Skipped {name}: {', '.join(sorted(unresolved))} not built")
+                continue
+        data = text.encode('utf-8')
+        manifest[name] = _fingerprint(name, data)
+        outputs.update(_write(dist, manifest[name], data))
+        log(f"Built {manifest[name]}: {size} -> {len(data)} bytes")
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+    for filename in os.listdir(dist):
+        if filename not in outputs:
+            os.remove(os.path.join(dist, filename))  # Outputs of earlier builds
+    return manifest
+
+
+class AssetManifest:
+    """Maps bundle names to their fingerprinted URLs under /static/dist/.
+
+    The manifest is read once, or on every lookup with reload (debug), so
+    a rebuild shows up without a restart. Bundles that aren't built fall
+    back to their CDN URL, with a warning (once each) since that is only
+    a safety net; anything else unknown is a build mistake.
+    """
+
+    def __init__(self, root, url_prefix='/static/dist/', reload=False, logger=None):
+        self.path = os.path.join(root, DIST_DIR, MANIFEST)
+        self.url_prefix = url_prefix
+        self.reload = reload
+        self.logger = logger
+        self._entries = None
+        self._warned = set()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def url(self, name):
+        if self._entries is None or self.reload:
+            self._entries = self._load()
+        target = self._entries.get(name)
+        if target is not None:
+            return self.url_prefix + target
+        if name in FALLBACK_URLS:
+            if self.logger is not None and name not in self._warned:
+                self._warned.add(name)
+                self.logger.warning(f"Asset {name!r} isn't built; loading it from {FALLBACK_URLS[name]}. "
+                                    "Run `flask --app app build-assets --fetch` and commit assets/vendor/ and static/dist/")
+            return FALLBACK_URLS[name]
+        raise KeyError(f"Asset {name!r} isn't built; run `flask --app app build-assets`")
+
+
+def negotiate(dist, filename, accept_encoding):
+    """Pick the precompressed variant of filename the client accepts.
+
+    Returns (path, content_encoding) with content_encoding None for the
+    plain file.
+    """
+    accepted = {
+        part.split(';')[0].strip() for part in accept_encoding.lower().split(',')
+        if not re.search(r';\s*q=0(\.0*)?\s*$', part)
+    }
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in accepted and os.path.exists(os.path.join(dist, filename + suffix)):
+            return filename + suffix, encoding
+    return filename, None
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""Seed a benchmark database and measure Flowrite's routes.
+
+    python benchmark.py                              # Flask test client, single thread
+    python benchmark.py --gunicorn --workers 4 --concurrency 16
+    python benchmark.py --baseline instance/benchmarks/previous.json
+
+Uses its own database (instance/bench.db by default), never flowrite.db.
+Results are printed per route (throughput, p50/p95/p99), along with cold-start
+times (import, create_app(), first request), and written as JSON so runs can
+be compared with --baseline. The save routes run a second time with group
+commit on ("POST /write (group commit)"), unless --no-group-commit.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_PASSWORD = 'bench-password'
+
+WORDS = (
+    "the quiet morning light fell across the desk while a cup of tea went cold "
+    "thoughts drift between half finished sentences and small notes about the day "
+    "somewhere a train passes and the page fills slowly one line after another"
+).split()
+
+# (name, method, path); {post_id} is one of the logged-in user's posts
+ROUTES = [
+    ("GET /", 'GET', '/'),
+    ("GET /shelf", 'GET', '/shelf'),
+    ("GET /posts/<id>", 'GET', '/posts/{post_id}'),
+    ("GET /write", 'GET', '/write'),
+    ("POST /write", 'POST', '/write'),
+    ("POST /login", 'POST', '/login'),
+    ("GET /posts/<id>/edit", 'GET', '/posts/{post_id}/edit'),
+    ("POST /posts/<id>/edit", 'POST', '/posts/{post_id}/edit'),
+]
+# Run a second time with FLOWRITE_GROUP_COMMIT=1, saves going through the writer thread
+GROUP_COMMIT_ROUTES = {"POST /write", "POST /posts/<id>/edit"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=os.path.join(PROJECT_DIR, 'instance', 'bench.db'))
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--posts', type=int, default=2000, help='Total posts, spread across users')
+    parser.add_argument('--post-chars', type=int, default=2000, help='Approximate length of each post')
+    parser.add_argument('--no-seed', action='store_true', help='Reuse the existing benchmark database')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route')
+    parser.add_argument('--routes', help='Comma-separated route names to run, e.g. "GET /,GET /shelf"')
+    parser.add_argument('--gunicorn', action='store_true', help='Drive a real gunicorn server over HTTP')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads (gunicorn mode)')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--startup-runs', type=int, default=5, help='Fresh interpreters timed for the startup figures')
+    parser.add_argument('--output', help='JSON results path (default: instance/benchmarks/<timestamp>.json)')
+    parser.add_argument('--baseline', help='Earlier JSON results to compare against')
+    parser.add_argument('--no-group-commit', action='store_true', help='Skip the group commit pass over the save routes')
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    # Must happen before app is imported anywhere (here or in gunicorn)
+    os.environ['FLASK_ENV'] = 'development'
+    os.environ['FLOWRITE_DATABASE'] = args.database
+    os.environ['FLOWRITE_RATELIMIT_ENABLED'] = '0'
+
+
+def random_text(rng, chars):
+    words = []
+    length = 0
+    while length < chars:
+        word = rng.choice(WORDS)
+        words.append(word + ('\n' if rng.random() < 0.08 else ' '))
+        length += len(word) + 1
+    return ''.join(words)
+
+
+def seed(args):
+    """Recreate the benchmark database with args.users users and args.posts posts."""
+    for suffix in ('', '-wal', '-shm', '.schema'):
+        if os.path.exists(args.database + suffix):
+            os.remove(args.database + suffix)
+    os.makedirs(os.path.dirname(args.database), exist_ok=True)
+
+    from werkzeug.security import generate_password_hash
+    import app as flowrite
+    from db import make_preview
+
+    app = flowrite.create_app()  # Creates the schema
+    rng = random.Random(42)
+    password = generate_password_hash(BENCH_PASSWORD, method='pbkdf2')  # One hash, shared by all users
+    start = datetime(2024, 1, 1)
+
+    with app.app_context():
+        db = flowrite.get_db()
+        db.execute("BEGIN")
+        db.executemany(
+            "INSERT INTO user (username, password) VALUES (?, ?)",
+            [(f"bench{i}", password) for i in range(args.users)]
+        )
+        rows = []
+        for i in range(args.posts):
+            content = random_text(rng, args.post_chars)
+            created = start + timedelta(minutes=17 * i)
+            rows.append((i % args.users + 1, content, make_preview(content), f"{created:%Y-%m-%d %H:%M:%S}"))
+        db.executemany(
+            "INSERT INTO post (user_id, content, preview, created_at) VALUES (?, ?, ?, ?)", rows
+        )
+        db.execute("COMMIT")
+    print(f"Seeded {args.users} users and {args.posts} posts into {args.database}")
+
+
+STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app as flowrite
+imported = time.perf_counter()
+app = flowrite.create_app()
+created = time.perf_counter()
+app.test_client().get('/')
+answered = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (answered - created) * 1000,
+}))
+"""
+
+
+def measure_startup(runs):
+    """Cold-start cost in fresh interpreters: import, create_app() and the first request.
+
+    Takes the median of runs; process_ms also counts interpreter startup.
+    """
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT], cwd=PROJECT_DIR, env=os.environ.copy(),
+            capture_output=True, text=True, check=True
+        ).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample['process_ms'] = (time.perf_counter() - started) * 1000
+        samples.append(sample)
+    return {
+        key: round(sorted(sample[key] for sample in samples)[len(samples) // 2], 1)
+        for key in samples[0]
+    }
+
+
+def user_post_ids(database, user_id):
+    import sqlite3
+    conn = sqlite3.connect(database)
+    try:
+        return [row[0] for row in conn.execute("SELECT id FROM post WHERE user_id = ? ORDER BY id", (user_id,))]
+    finally:
+        conn.close()
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(int(round(p * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rps": round(len(values) / elapsed, 1) if elapsed else None,
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 0.50)),
+        "p95_ms": ms(percentile(values, 0.95)),
+        "p99_ms": ms(percentile(values, 0.99)),
+    }
+
+
+def request_body(method, path, rng):
+    """Form data for the POST routes."""
+    if method != 'POST':
+        return None
+    if path == '/login':
+        return {'username': 'bench0', 'password': BENCH_PASSWORD}
+    return {'content': random_text(rng, 1500)}
+
+
+def run_test_client(args, routes, group_commit=False):
+    import app as flowrite
+    from config import config
+
+    config_name = None
+    if group_commit:
+        # The config classes were read at import, so the setting goes on a subclass
+        config['bench-group-commit'] = type('GroupCommitConfig', (config['development'],), {'GROUP_COMMIT': True})
+        config_name = 'bench-group-commit'
+    client = flowrite.create_app(config_name).test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1  # bench0, the same user POST /login signs in as
+        sess['username'] = 'bench0'
+    post_ids = user_post_ids(args.database, 1)
+    rng = random.Random(7)
+    results = {}
+
+    for name, method, template in routes:
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            path = template.format(post_id=rng.choice(post_ids))
+            data = request_body(method, template, rng)
+            t0 = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            latencies.append(time.perf_counter() - t0)
+            if response.status_code >= 400:
+                errors += 1
+        results[name] = summarize(latencies, errors, time.perf_counter() - started)
+        print_row(name, results[name])
+    return results
+
+
+class HTTPSession:
+    """Minimal keep-alive HTTP client holding one session cookie, no redirects."""
+
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        self.cookie = None
+
+    def request(self, method, path, data=None):
+        headers = {}
+        body = None
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if data is not None:
+            body = urllib.parse.urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        response.read()
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie and set_cookie.startswith('session='):
+            self.cookie = set_cookie.split(';', 1)[0]
+        return response.status
+
+    def login(self):
+        status = self.request('POST', '/login', {'username': 'bench0', 'password': BENCH_PASSWORD})
+        if status != 302:
+            raise RuntimeError(f"benchmark login failed with HTTP {status}")
+
+
+def start_gunicorn(args, group_commit=False):
+    # --preload: one app import in the master, so every worker shares the session secret
+    command = [
+        sys.executable, '-m', 'gunicorn', '--preload',
+        '-w', str(args.workers), '-b', f'127.0.0.1:{args.port}',
+        '--log-level', 'warning', 'app:create_app()',
+    ]
+    started = time.perf_counter()
+    env = os.environ.copy()
+    if group_commit:
+        env['FLOWRITE_GROUP_COMMIT'] = '1'
+    server = subprocess.Popen(command, cwd=PROJECT_DIR, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', args.port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                print(f"gunicorn answered /health {(time.perf_counter() - started) * 1000:.0f} ms after launch")
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("gunicorn did not become ready within 30s")
+
+
+def run_gunicorn(args, routes, group_commit=False):
+    server = start_gunicorn(args, group_commit)
+    post_ids = user_post_ids(args.database, 1)
+    results = {}
+    try:
+        # Log every client in up front so the pbkdf2 check isn't timed with each route
+        sessions = [HTTPSession(args.port) for _ in range(args.concurrency)]
+        for session in sessions:
+            session.login()
+
+        for name, method, template in routes:
+            latencies = []
+            errors = [0]
+            lock = threading.Lock()
+            per_thread = max(args.requests // args.concurrency, 1)
+
+            def worker(session, seed_value):
+                rng = random.Random(seed_value)
+                local = []
+                local_errors = 0
+                for _ in range(per_thread):
+                    path = template.format(post_id=rng.choice(post_ids))
+                    data = request_body(method, template, rng)
+                    t0 = time.perf_counter()
+                    status = session.request(method, path, data)
+                    local.append(time.perf_counter() - t0)
+                    if status >= 400:
+                        local_errors += 1
+                with lock:
+                    latencies.extend(local)
+                    errors[0] += local_errors
+
+            threads = [threading.Thread(target=worker, args=(session, i)) for i, session in enumerate(sessions)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            results[name] = summarize(latencies, errors[0], time.perf_counter() - started)
+            print_row(name, results[name])
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return results
+
+
+def print_row(name, stats):
+    print(f"{name:<26} {stats['rps'] or 0:>9.1f} req/s   p50 {stats['p50_ms']:>8.2f} ms   "
+          f"p95 {stats['p95_ms']:>8.2f} ms   p99 {stats['p99_ms']:>8.2f} ms   errors {stats['errors']}")
+
+
+def compare(results, startup, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+    baseline = previous['routes']
+    print(f"\nCompared with {baseline_path}:")
+    if previous.get('startup') and startup:
+        changes = [
+            f"{key} {100 * (startup[key] - previous['startup'][key]) / previous['startup'][key]:+.1f}%"
+            for key in ('import_ms', 'create_app_ms', 'process_ms') if previous['startup'].get(key)
+        ]
+        print(f"{'startup':<26} " + '   '.join(changes))
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ('rps', 'p50_ms', 'p99_ms'):
+            if before.get(key) and stats.get(key) is not None:
+                changes.append(f"{key} {100 * (stats[key] - before[key]) / before[key]:+.1f}%")
+        print(f"{name:<26} " + '   '.join(changes))
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+    sys.path.insert(0, PROJECT_DIR)
+
+    if not args.no_seed:
+        seed(args)
+
+    routes = ROUTES
+    if args.routes:
+        wanted = {name.strip() for name in args.routes.split(',')}
+        routes = [route for route in ROUTES if route[0] in wanted]
+
+    startup = measure_startup(args.startup_runs)
+    print(f"\nstartup (median of {args.startup_runs}): import {startup['import_ms']:.1f} ms   "
+          f"create_app {startup['create_app_ms']:.1f} ms   first request {startup['first_request_ms']:.1f} ms   "
+          f"whole process {startup['process_ms']:.1f} ms")
+
+    mode = 'gunicorn' if args.gunicorn else 'test-client'
+    print(f"\n{mode}: {args.requests} requests per route")
+    run = run_gunicorn if args.gunicorn else run_test_client
+    results = run(args, routes)
+
+    group_commit_routes = [route for route in routes if route[0] in GROUP_COMMIT_ROUTES]
+    if group_commit_routes and not args.no_group_commit:
+        print("\ngroup commit (FLOWRITE_GROUP_COMMIT=1):")
+        for name, stats in run(args, group_commit_routes, group_commit=True).items():
+            results[f"{name} (group commit)"] = stats
+
+    output = args.output or os.path.join(
+        PROJECT_DIR, 'instance', 'benchmarks', f"{datetime.now():%Y%m%d-%H%M%S}-{mode}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            "meta": {
+                "timestamp": datetime.now().isoformat(timespec='seconds'),
+                "git": git_revision(),
+                "mode": mode,
+                "users": args.users,
+                "posts": args.posts,
+                "post_chars": args.post_chars,
+                "requests_per_route": args.requests,
+                "workers": args.workers if args.gunicorn else None,
+                "concurrency": args.concurrency if args.gunicorn else 1,
+                "python": sys.version.split()[0],
+            },
+            "startup": startup,
+            "routes": results,
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        compare(results, startup, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
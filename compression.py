@@ -0,0 +1,143 @@
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; zlib is always there
+    zstandard = None
+
+# A compressed post is a BLOB: codec tag, dictionary id (0 = none), payload.
+# Uncompressed posts stay TEXT, so both kinds can live side by side.
+_HEADER = struct.Struct('>cI')
+CODECS = {'zlib': b'z', 'zstd': b's'}
+ZLIB_DICT_SIZE = 32 * 1024  # Deflate can't look further back than this
+ZSTD_DICT_SIZE = 64 * 1024
+DICT_REFRESH_SECONDS = 60  # How soon workers pick up a newly trained dictionary
+
+
+def train_dictionary(codec, samples):
+    """Build a shared dictionary for codec from sample post texts."""
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd needs the 'zstandard' package")
+        return zstandard.train_dictionary(ZSTD_DICT_SIZE, [s.encode('utf-8') for s in samples]).as_bytes()
+    # zlib has no trainer; common words, the most frequent last (closest to
+    # the data, so cheapest to reference), make a good preset dictionary for prose
+    counts = Counter(word for sample in samples for word in sample.split() if len(word) > 2)
+    words = [word for word, _ in reversed(counts.most_common())]
+    return ' '.join(words).encode('utf-8')[-ZLIB_DICT_SIZE:]
+
+
+class ContentCodec:
+    """Compress post bodies on write and decompress them on read.
+
+    compress() returns text unchanged when compression is off, the text is
+    shorter than min_chars or it wouldn't save at least 10%. decompress()
+    takes either kind and always works, whatever the current settings, so
+    compression can be switched on and off without rewriting anything.
+    Dictionaries live in the content_dict table and are loaded on demand.
+    """
+
+    def __init__(self, database, codec=None, min_chars=1024, level=6, metrics=None):
+        if codec not in (None, *CODECS):
+            raise ValueError(f"Unknown compression codec {codec!r}")
+        if codec == 'zstd' and zstandard is None:
+            raise RuntimeError("CONTENT_COMPRESSION = 'zstd' needs the 'zstandard' package")
+        self.database = database
+        self.codec = codec
+        self.min_chars = min_chars
+        self.level = level
+        self.metrics = metrics
+        self._dicts = {}  # id -> bytes; dictionaries are never changed once stored
+        self._current = (0, None)
+        self._current_checked = 0.0
+        self._lock = threading.Lock()
+
+    def _query(self, sql, args=()):
+        # Own short-lived connection: this runs inside SQL functions on pooled ones
+        conn = sqlite3.connect(self.database)
+        try:
+            return conn.execute(sql, args).fetchone()
+        except sqlite3.OperationalError:
+            return None  # content_dict not created yet
+        finally:
+            conn.close()
+
+    def _dictionary(self, dict_id):
+        if dict_id == 0:
+            return None
+        data = self._dicts.get(dict_id)
+        if data is None:
+            row = self._query("SELECT data FROM content_dict WHERE id = ?", (dict_id,))
+            if row is None:
+                raise ValueError(f"Missing compression dictionary {dict_id}")
+            data = self._dicts[dict_id] = row[0]
+        return data
+
+    def _current_dictionary(self):
+        now = time.monotonic()
+        if now - self._current_checked > DICT_REFRESH_SECONDS:
+            with self._lock:
+                row = self._query(
+                    "SELECT id, data FROM content_dict WHERE codec = ? ORDER BY id DESC LIMIT 1", (self.codec,)
+                )
+                if row is not None:
+                    self._dicts[row[0]] = row[1]
+                self._current = (row[0], row[1]) if row else (0, None)
+                self._current_checked = now
+        return self._current
+
+    def refresh(self):
+        """Use the newest dictionary from the next compress() on."""
+        self._current_checked = 0.0
+
+    def compress(self, text):
+        if self.codec is None or text is None or len(text) < self.min_chars:
+            return text
+        start = time.perf_counter()
+        raw = text.encode('utf-8')
+        dict_id, zdict = self._current_dictionary()
+        if self.codec == 'zstd':
+            dict_data = zstandard.ZstdCompressionDict(zdict) if zdict else None
+            payload = zstandard.ZstdCompressor(level=self.level, dict_data=dict_data).compress(raw)
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=zdict) if zdict \
+                else zlib.compressobj(self.level, zlib.DEFLATED, -15)
+            payload = compressor.compress(raw) + compressor.flush()
+        stored = _HEADER.pack(CODECS[self.codec], dict_id) + payload
+        self._record('flowrite_content_compress_seconds', self.codec, start)
+        if len(stored) > len(raw) * 0.9:
+            return text  # Not worth a decompress on every read
+        if self.metrics is not None:
+            self.metrics.inc('flowrite_content_bytes_total', {"stage": "raw"}, len(raw))
+            self.metrics.inc('flowrite_content_bytes_total', {"stage": "stored"}, len(stored))
+        return stored
+
+    def decompress(self, value):
+        if not isinstance(value, bytes):
+            return value
+        start = time.perf_counter()
+        tag, dict_id = _HEADER.unpack_from(value)
+        payload = value[_HEADER.size:]
+        zdict = self._dictionary(dict_id)
+        codec = 'zstd' if tag == CODECS['zstd'] else 'zlib'
+        if tag == CODECS['zstd']:
+            if zstandard is None:
+                raise RuntimeError("This post is zstd-compressed; install the 'zstandard' package")
+            dict_data = zstandard.ZstdCompressionDict(zdict) if zdict else None
+            raw = zstandard.ZstdDecompressor(dict_data=dict_data).decompress(payload)
+        elif tag == CODECS['zlib']:
+            decompressor = zlib.decompressobj(-15, zdict=zdict) if zdict else zlib.decompressobj(-15)
+            raw = decompressor.decompress(payload) + decompressor.flush()
+        else:
+            raise ValueError(f"Unknown compressed content tag {tag!r}")
+        self._record('flowrite_content_decompress_seconds', codec, start)
+        return raw.decode('utf-8')
+
+    def _record(self, name, codec, start):
+        if self.metrics is not None:
+            self.metrics.observe(name, {"codec": codec}, time.perf_counter() - start)
@@ -1,51 +1,142 @@
 import os
-import secrets
 
 class Config:
     """Base configuration."""
     # Security
-    SECRET_KEY = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
+    SECRET_KEY = os.environ.get('SECRET_KEY')  # Unset: create_app() generates one once, in instance/secret_key
     SESSION_COOKIE_SECURE = True
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
     PERMANENT_SESSION_LIFETIME = 1800  # 30 minutes
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB
+    IMPORT_MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB, /shelf/import only
 
     # Database
-    DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'flowrite.db')
+    DATABASE = os.environ.get('FLOWRITE_DATABASE') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'flowrite.db')
+    # Create/migrate the database when the app is built, skipped while <DATABASE>.schema
+    # says it is already at this code's version (so once per deploy, not per worker)
+    SCHEMA_CHECK = True
+    DB_POOL_SIZE = 8  # Connections per worker process
+    SQLITE_PRAGMAS = {
+        'busy_timeout': 10000,
+        'auto_vacuum': 'INCREMENTAL',  # Must come before journal_mode to apply to a new database
+        'journal_mode': 'WAL',
+        'foreign_keys': 'ON',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,  # ~16MB per connection
+        'mmap_size': 134217728,  # 128MB
+        'temp_store': 'MEMORY',
+    }
+
+    # Group commit: one writer thread per worker batches post saves into a
+    # single transaction (up to MAX_BATCH saves or MAX_DELAY_MS after the first)
+    GROUP_COMMIT = os.environ.get('FLOWRITE_GROUP_COMMIT') == '1'
+    GROUP_COMMIT_MAX_BATCH = 32
+    GROUP_COMMIT_MAX_DELAY_MS = 5
+    
+    # Sharding (shards.py): with SHARD_COUNT > 0, users' posts live in that many
+    # files next to DATABASE (flowrite.shard-0.db, ...), picked by a hash of
+    # the user id, so saves by different users don't queue on one write lock.
+    # DATABASE keeps the accounts. `flask --app app split-shards` moves an
+    # existing database's posts over; the count can't change afterwards.
+    SHARD_COUNT = int(os.environ.get('FLOWRITE_SHARDS', '0'))
+    
+    # At-rest compression of post bodies (compression.py): None, 'zlib' or
+    # 'zstd' (needs the zstandard package). Posts are compressed as they are
+    # saved; `flask --app app compress-posts` converts the rest.
+    CONTENT_COMPRESSION = os.environ.get('FLOWRITE_COMPRESSION') or None
+    CONTENT_COMPRESSION_MIN_CHARS = 1024  # Shorter posts stay plain text
+    CONTENT_COMPRESSION_LEVEL = 6
+    
+    # Password hashing (passwords.py). Changing the cost re-hashes each
+    # account at its next successful login.
+    PASSWORD_HASH_ITERATIONS = 1_000_000  # pbkdf2:sha256
+    PASSWORD_HASH_THREADS = 2  # Per worker
+    PASSWORD_HASH_MAX_QUEUE = 16  # Further logins/sign-ups get a 503 until it drains
+    
+    # Per-worker LRU of rendered shelf/post pages, checked against their ETag
+    PAGE_CACHE = os.environ.get('FLOWRITE_PAGE_CACHE') == '1'
+    PAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+    
+    # Render posts and shelf previews as markdown (content.PostRenderer) instead
+    # of plain text. Each worker keeps an LRU of the HTML by text hash, and a
+    # post's first view stores its HTML in post.rendered_html for the others.
+    MARKDOWN_POSTS = os.environ.get('FLOWRITE_MARKDOWN') == '1'
+    MARKDOWN_CACHE_MAX_BYTES = 16 * 1024 * 1024
+    
+    # ASGI mode (pa_asgi.py / live.py): requests run on LIVE_HTTP_THREADS per
+    # worker; each open editor keeps a /live WebSocket for draft saves and
+    # session-expiry warnings, which needs no thread while it is idle
+    LIVE_HTTP_THREADS = 16
+    LIVE_DB_THREADS = 4  # Run the SQLite work of /live messages
+    LIVE_SESSION_WARNING_SECONDS = 300
+    LIVE_MAX_MESSAGES_PER_MINUTE = 120  # Per connection, like PATCH /api/drafts
+    
+    # Static assets (assets.py): `flask --app app build-assets` writes fingerprinted,
+    # precompressed bundles to static/dist/, which are cached by browsers for good
+    ASSETS_MAX_AGE = 365 * 24 * 3600
+    
+    # Database maintenance (maintenance.py); the scheduler runs it every
+    # MAINTENANCE_INTERVAL_SECONDS in each worker, one worker at a time
+    MAINTENANCE_SCHEDULER = os.environ.get('FLOWRITE_MAINTENANCE') == '1'
+    MAINTENANCE_INTERVAL_SECONDS = 300
+    MAINTENANCE_WAL_THRESHOLD_BYTES = 32 * 1024 * 1024  # Checkpoint(TRUNCATE) above this
+    MAINTENANCE_ANALYZE_RATIO = 0.2  # ANALYZE once post count drifts this far from the last run
+    MAINTENANCE_VACUUM_STEP_PAGES = 256
+    MAINTENANCE_VACUUM_MAX_STEPS = 40  # Per run, so ~10k pages (40MB at 4KB pages)
     
     # Rate Limiting
+    RATELIMIT_ENABLED = os.environ.get('FLOWRITE_RATELIMIT_ENABLED', '1') != '0'  # benchmark.py turns it off
     RATELIMIT_DEFAULT = "2000 per day;500 per hour"
-    RATELIMIT_STORAGE_URI = os.environ.get('REDIS_URL', 'memory://')
+    # Counters live in a local SQLite file shared by all workers (ratelimit_storage.py);
+    # set REDIS_URL to use Redis instead
+    RATELIMIT_STORAGE_URI = os.environ.get('REDIS_URL') or 'sqlite://' + os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'ratelimit.db')
+    RATELIMIT_STRATEGY = 'moving-window'
+    
+    # Metrics (/metrics): each worker writes its totals here for the others to sum
+    METRICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics')
+    METRICS_FLUSH_SECONDS = 5
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
+    # /health: results are cached per worker for HEALTH_CACHE_SECONDS; any
+    # threshold crossed reports "degraded" (fewer than a tenth of the free
+    # disk minimum, or a failing database probe, reports "fail")
+    HEALTH_CACHE_SECONDS = 2
+    HEALTH_DB_SLOW_MS = 100
+    HEALTH_WAL_MAX_BYTES = 64 * 1024 * 1024
+    HEALTH_WAL_MAX_LAG = 10000  # Frames in the -wal file (it only shrinks on a TRUNCATE checkpoint)
+    HEALTH_MIN_FREE_BYTES = 200 * 1024 * 1024
+    HEALTH_P99_MAX_MS = 1000  # Over this worker's last HEALTH_LATENCY_SAMPLES requests
+    HEALTH_LATENCY_SAMPLES = 1000
     
     # Logging
     LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
     LOG_FORMAT = '[%(asctime)s] %(levelname)s: %(message)s'
     LOG_LEVEL = 'INFO'
+    LOG_QUEUE_SIZE = 10000  # Records buffered between request threads and the log writer
+    LOG_QUEUE_POLICY = 'drop'  # 'drop' when full, or 'block' briefly (50ms) before dropping
 
 class DevelopmentConfig(Config):
     """Development configuration."""
     FLASK_ENV = 'development'
     DEBUG = True
     SESSION_COOKIE_SECURE = False  # Allow HTTP in development
-    DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'flowrite_dev.db')
+    DATABASE = os.environ.get('FLOWRITE_DATABASE') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'flowrite_dev.db')
 
 class ProductionConfig(Config):
     """Production configuration."""
     FLASK_ENV = 'production'
     DEBUG = False
     SESSION_COOKIE_SECURE = True  # Require HTTPS
-    # In PythonAnywhere, you might want to set an absolute path
-    DATABASE = '/home/YOUR_USERNAME/flowrite/instance/flowrite.db'
     
     # Enhanced security settings
     PERMANENT_SESSION_LIFETIME = 1800  # 30 minutes
     
     # Production logging
     LOG_LEVEL = 'WARNING'  # Less verbose logging in production
-    
-    # Rate limiting with Redis in production
-    RATELIMIT_STORAGE_URI = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 
 # Configuration dictionary
 config = {
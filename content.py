@@ -0,0 +1,178 @@
+import hashlib
+import html
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from werkzeug.security import safe_join
+
+
+class RenderedContent(NamedTuple):
+    html: str
+    etag: str
+    last_modified: datetime
+
+
+class MarkdownCache:
+    """Rendered markdown files under one directory, keyed on path + mtime.
+
+    A hit costs a single stat(); a changed file is re-read and re-rendered
+    on the next request that asks for it.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """Return RenderedContent for name, raising FileNotFoundError if missing."""
+        path = safe_join(self.root, name)
+        if path is None:
+            raise FileNotFoundError(name)
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        with open(path, 'r', encoding='utf-8') as file:
+            source = file.read()
+        import markdown  # Only needed once a page is rendered; keeps it out of startup
+        rendered = RenderedContent(
+            html=markdown.markdown(source),
+            etag=hashlib.sha256(source.encode('utf-8')).hexdigest()[:32],
+            last_modified=datetime.fromtimestamp(int(stat.st_mtime), timezone.utc),
+        )
+        with self._lock:
+            self._entries[path] = (key, rendered)
+        return rendered
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+POST_MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'sane_lists', 'nl2br']
+SAFE_URL_SCHEMES = ('http', 'https', 'mailto')
+
+
+def _safe_url(url):
+    """Whether url is relative or uses one of SAFE_URL_SCHEMES, as a browser would read it.
+
+    Entities survive into the attribute and browsers decode them, and skip
+    whitespace and control characters, so the scheme is taken from the
+    URL with both resolved.
+
+    >>> [_safe_url(url) for url in ('https://example.com', '/posts/1', 'notes#top', 'mailto:a@b.c')]
+    [True, True, True, True]
+    >>> [_safe_url(url) for url in ('javascript:alert(1)', 'JaVaScRiPt:x', 'data:text/html,x', 'java\tscript:x')]
+    [False, False, False, False]
+    >>> [_safe_url(url) for url in ('javascript&#58;alert(1)', 'javascript&colon;alert(1)', 'javascript&#x3A;x')]
+    [False, False, False]
+    >>> [_safe_url(url) for url in ('&#106;avascript:x', '\x01javascript:x', 'java&#9;script:x', 'java&NewLine;script:x')]
+    [False, False, False, False]
+    """
+    url = ''.join(char for char in html.unescape(url) if char.isprintable() and not char.isspace())
+    scheme = url.split(':', 1)[0].lower() if ':' in url.split('/', 1)[0] else None
+    return scheme is None or scheme in SAFE_URL_SCHEMES
+
+
+def _post_markdown():
+    """A Markdown converter for user text: raw HTML is escaped, not passed through."""
+    import markdown
+    from markdown.treeprocessors import Treeprocessor
+
+    class SafeLinks(Treeprocessor):
+        # javascript:, data: and friends become plain text links to nowhere
+        def run(self, root):
+            for element in root.iter():
+                for attribute in ('href', 'src'):
+                    value = element.get(attribute)
+                    if value is not None and not _safe_url(value):
+                        del element.attrib[attribute]
+
+    md = markdown.Markdown(extensions=POST_MARKDOWN_EXTENSIONS, output_format='html')
+    md.preprocessors.deregister('html_block')
+    md.inlinePatterns.deregister('html')
+    md.treeprocessors.register(SafeLinks(md), 'safe_links', -10)  # After links are built and unescaped
+    return md
+
+
+class PostRenderer:
+    """Sanitized HTML for post markdown, in a byte-bounded LRU keyed by the text's SHA-256.
+
+    Identical text is rendered once per worker however many posts, pages or
+    previews show it; an edit changes the key, so nothing is ever stale.
+    Markdown instances aren't thread-safe, so each thread gets its own.
+    max_bytes=0 renders every time.
+    """
+
+    def __init__(self, max_bytes, metrics=None):
+        self.max_bytes = max_bytes
+        self.metrics = metrics
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # sha256 -> html
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def put(self, key, html):
+        if len(html) > self.max_bytes // 4:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = html
+            self.size += len(html)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def convert(self, text):
+        """Render text without touching the cache."""
+        md = getattr(self._local, 'md', None)
+        if md is None:
+            md = self._local.md = _post_markdown()
+        start = time.perf_counter()
+        html = md.reset().convert(text)
+        if self.metrics is not None:
+            self.metrics.observe('flowrite_markdown_render_seconds', {}, time.perf_counter() - start)
+        return html
+
+    def render(self, text, key=None):
+        key = key or self.key(text)
+        html = self.get(key)
+        if html is None:
+            html = self.convert(text)
+            self.put(key, html)
+        return html
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,310 @@
+import sqlite3
+import threading
+
+from forksafe import ForkSafe
+from search import SEARCH_SCHEMA
+from stats import STATS_SCHEMA
+
+# Applied once per connection when it is opened, not per request
+DEFAULT_PRAGMAS = {
+    'busy_timeout': 10000,      # ms to wait on a locked database
+    'auto_vacuum': 'INCREMENTAL',  # only takes effect on a new, empty file
+    'journal_mode': 'WAL',
+    'foreign_keys': 'ON',
+    'synchronous': 'NORMAL',    # safe with WAL, fewer fsyncs
+    'cache_size': -16000,       # negative = KiB, so ~16MB page cache per connection
+    'mmap_size': 134217728,     # 128MB memory-mapped reads
+    'temp_store': 'MEMORY',
+}
+
+PREVIEW_CHARS = 280  # Enough for the five clamped lines of a shelf card
+MIGRATION_BATCH_SIZE = 500
+
+
+def make_preview(content):
+    """Truncated plain-text preview stored alongside a post for the shelf."""
+    if len(content) <= PREVIEW_CHARS:
+        return content
+    return content[:PREVIEW_CHARS].rstrip() + '…'
+
+
+class ConnectionPool(ForkSafe):
+    """Per-process pool of preconfigured SQLite connections.
+
+    Connections are created lazily up to max_size and handed out one thread
+    at a time. A checkout that finds the pool empty and full waits up to
+    timeout seconds before raising sqlite3.OperationalError. functions maps
+    names to Python callables registered as SQL functions on every connection.
+    """
+
+    def __init__(self, database, max_size=8, timeout=10, pragmas=None, factory=sqlite3.Connection, functions=None):
+        self.database = database
+        self.factory = factory
+        self.functions = dict(functions or {})
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+
+    def _start(self):
+        # A forked worker must never share the parent's sqlite handles
+        self._cond = threading.Condition()
+        self._idle = []
+        self._open = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,  # owned by one thread at a time via the pool
+            factory=self.factory,
+        )
+        conn.row_factory = sqlite3.Row  # Enable dict-like access to rows
+        for name, fn in self.functions.items():
+            conn.create_function(name, -1, fn, deterministic=True)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def acquire(self):
+        """Check out a connection, opening a new one if the pool has room."""
+        self._ensure_started()
+        with self._cond:
+            self.checkouts += 1
+            if not self._idle and self._open >= self.max_size:
+                self.waits += 1
+                ready = self._cond.wait_for(
+                    lambda: self._idle or self._open < self.max_size, self.timeout
+                )
+                if not ready:
+                    self.timeouts += 1
+                    raise sqlite3.OperationalError("database connection pool exhausted")
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back anything left open."""
+        if not self.started:
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self):
+        """Close all idle connections (e.g. at shutdown)."""
+        if not self.started:
+            return  # Nothing opened in this process
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        self._ensure_started()
+        with self._cond:
+            return {
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "max_size": self.max_size,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+            }
+
+
+def _add_post_preview(db):
+    """v1: preview column and a covering (user_id, created_at, id) index for the shelf.
+
+    Previews are filled MIGRATION_BATCH_SIZE posts per transaction, so the
+    write lock is let go between batches; a run that was interrupted picks
+    up the posts still without one.
+    """
+    columns = [row[1] for row in db.execute("PRAGMA table_info(post)")]
+    if 'preview' not in columns:  # Else added by the interrupted run
+        db.execute("ALTER TABLE post ADD COLUMN preview TEXT")
+    last_id = 0
+    while True:
+        rows = db.execute(
+            "SELECT id, content FROM post WHERE id > ? AND preview IS NULL ORDER BY id LIMIT ?",
+            (last_id, MIGRATION_BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        db.executemany(
+            "UPDATE post SET preview = ? WHERE id = ?",
+            [(make_preview(row['content'] or ''), row['id']) for row in rows]
+        )
+        last_id = rows[-1]['id']
+        # migrate() opened the transaction and commits the last one, with the version
+        db.execute("COMMIT")
+        db.execute("BEGIN IMMEDIATE")
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_post_user_created
+        ON post (user_id, created_at DESC, id DESC, preview)
+    """)
+
+
+def _add_post_search(db):
+    """v2: FTS5 index over post content. Existing posts are indexed by `flask backfill-search`."""
+    for statement in SEARCH_SCHEMA:
+        db.execute(statement)
+
+
+def _add_drafts(db):
+    """v3: autosaved drafts, kept apart from published posts."""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS draft (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            post_id INTEGER,
+            content TEXT NOT NULL DEFAULT '',
+            version INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES user(id),
+            FOREIGN KEY(post_id) REFERENCES post(id) ON DELETE CASCADE
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_draft_user_post ON draft (user_id, post_id)")
+
+
+def _add_post_revisions(db):
+    """v4: edit history as compressed snapshots and line deltas."""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS post_revision (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id INTEGER NOT NULL,
+            revision INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            data BLOB NOT NULL,
+            length INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(post_id, revision),
+            FOREIGN KEY(post_id) REFERENCES post(id) ON DELETE CASCADE
+        )
+    """)
+
+
+def _add_user_post_version(db):
+    """v5: per-user counter of post changes, kept by triggers, for HTTP validators."""
+    db.execute("ALTER TABLE user ADD COLUMN post_version INTEGER NOT NULL DEFAULT 0")
+    for event, row in (('INSERT', 'new'), ('UPDATE OF content', 'new'), ('DELETE', 'old')):
+        name = event.split()[0].lower()
+        db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS post_version_{name} AFTER {event} ON post BEGIN
+                UPDATE user SET post_version = post_version + 1 WHERE id = {row}.user_id;
+            END
+        """)
+
+
+def _add_content_compression(db):
+    """v6: compressed post bodies. Search now indexes post_body, which decompresses them.
+
+    The index starts empty; `flask backfill-search` refills it in short
+    batches rather than this step holding the write lock for a 'rebuild'.
+    """
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS content_dict (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codec TEXT NOT NULL,
+            data BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    for trigger in ('post_fts_insert', 'post_fts_delete', 'post_fts_update'):
+        db.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    db.execute("DROP TABLE IF EXISTS post_fts")
+    for statement in SEARCH_SCHEMA:
+        db.execute(statement)
+
+
+def _add_user_stats(db):
+    """v7: per-user writing totals and daily rollup. Filled by `flask rebuild-stats` (or per user on first view)."""
+    for statement in STATS_SCHEMA:
+        db.execute(statement)
+
+
+def _add_post_rendered_html(db):
+    """v8: cached markdown rendering of each post, filled on first view and cleared by edits."""
+    db.execute("ALTER TABLE post ADD COLUMN rendered_html TEXT")
+
+
+def _add_user_shard(db):
+    """v9: which shard file holds each user's posts (NULL: this database), for SHARD_COUNT."""
+    db.execute("ALTER TABLE user ADD COLUMN shard INTEGER")
+
+
+def _clear_rendered_html(db):
+    """v10: drop HTML stored before the link sanitizer decoded entities (javascript&#58;); re-rendered on view."""
+    db.execute("UPDATE post SET rendered_html = NULL WHERE rendered_html IS NOT NULL")
+
+
+def _add_search_owner(db):
+    """v11: per-user owner column in the search index, so a search only visits its user's posts.
+
+    Like v6 the index starts over; `flask backfill-search` refills it.
+    """
+    for trigger in ('post_fts_insert', 'post_fts_delete', 'post_fts_update'):
+        db.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    db.execute("DROP TABLE IF EXISTS post_fts")
+    db.execute("DROP VIEW IF EXISTS post_body")
+    for statement in SEARCH_SCHEMA:
+        db.execute(statement)
+
+
+# Each step upgrades an existing database by one PRAGMA user_version.
+# schema.sql always creates the latest version directly.
+MIGRATIONS = [
+    _add_post_preview,
+    _add_post_search,
+    _add_drafts,
+    _add_post_revisions,
+    _add_user_post_version,
+    _add_content_compression,
+    _add_user_stats,
+    _add_post_rendered_html,
+    _add_user_shard,
+    _clear_rendered_html,
+    _add_search_owner,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(db):
+    """Apply pending migrations, one transaction per step. Returns the versions applied."""
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    applied = []
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            step(db)
+            db.execute(f"PRAGMA user_version = {number}")
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        applied.append(number)
+    return applied
@@ -0,0 +1,24 @@
+class PatchError(ValueError):
+    """A draft patch that doesn't fit the text it claims to apply to."""
+
+
+def apply_patches(content, patches):
+    """Apply splice patches to content and return the new text.
+
+    Each patch is {"start": int, "end": int, "text": str} and replaces
+    content[start:end] with text. Offsets are in characters (code points)
+    and each patch applies to the result of the one before it.
+    """
+    if not isinstance(patches, list):
+        raise PatchError("patches must be a list")
+    for patch in patches:
+        try:
+            start, end, text = patch['start'], patch['end'], patch['text']
+        except (KeyError, TypeError):
+            raise PatchError("each patch needs start, end and text")
+        if not (isinstance(start, int) and isinstance(end, int) and isinstance(text, str)):
+            raise PatchError("start and end must be integers and text a string")
+        if not 0 <= start <= end <= len(content):
+            raise PatchError(f"patch range {start}:{end} is outside the draft")
+        content = content[:start] + text + content[end:]
+    return content
@@ -0,0 +1,97 @@
+import json
+import zipfile
+from datetime import datetime, timezone
+
+EXPORT_BATCH_SIZE = 100  # Posts held in memory at once while streaming
+
+
+def parse_timestamp(value):
+    """SQLite CURRENT_TIMESTAMP text ('YYYY-MM-DD HH:MM:SS', UTC) to an aware datetime."""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+
+def iter_posts(db, user_id, batch_size=EXPORT_BATCH_SIZE):
+    """All of a user's posts oldest first, fetched in keyset batches of batch_size."""
+    last_id = 0
+    while True:
+        rows = db.execute(
+            """SELECT id, post_text(content) AS content, created_at, updated_at FROM post
+               WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?""",
+            (user_id, last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1]['id']
+
+
+class _ChunkSink:
+    """Write-only file object for ZipFile; drain() hands back what was written since."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def ndjson_chunks(posts):
+    for post in posts:
+        record = {
+            "id": post['id'],
+            "created_at": post['created_at'],
+            "updated_at": post['updated_at'],
+            "content": post['content'],
+        }
+        yield (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def zip_chunks(posts):
+    """Stream a ZIP with one markdown file per post.
+
+    The sink isn't seekable, so ZipFile writes data descriptors after each
+    member and only the central directory (one small entry per post) is kept
+    until the end. Output is byte-for-byte repeatable for the same posts,
+    which is what lets Range requests resume a download.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for post in posts:
+            created = parse_timestamp(post['created_at']) or datetime(1980, 1, 1)
+            info = zipfile.ZipInfo(
+                f"flowrite/{created:%Y-%m-%d}-{post['id']}.md",
+                date_time=(parse_timestamp(post['updated_at']) or created).timetuple()[:6],
+            )
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, post['content'] or '')
+            yield sink.drain()
+    yield sink.drain()
+
+
+EXPORT_FORMATS = {
+    'zip': (zip_chunks, 'application/zip'),
+    'ndjson': (ndjson_chunks, 'application/x-ndjson'),
+}
+
+
+def slice_chunks(chunks, start, stop):
+    """Bytes [start, stop) of a chunk stream, for Range responses."""
+    offset = 0
+    for chunk in chunks:
+        end = offset + len(chunk)
+        if end > start and offset < stop:
+            yield chunk[max(start - offset, 0):stop - offset]
+        offset = end
+        if offset >= stop:
+            return
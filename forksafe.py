@@ -0,0 +1,45 @@
+import os
+import threading
+
+# One lock for every object's start; starts are rare and quick
+_start_lock = threading.RLock()
+
+
+def _reset_lock():
+    # A thread of the parent may have held it at fork; the child starts afresh
+    global _start_lock
+    _start_lock = threading.RLock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_lock)
+
+
+class ForkSafe:
+    """Mixin for objects whose threads, queues or connections belong to one process.
+
+    None of those survive fork(), and an app built before gunicorn forks
+    (--preload) hands its objects to every worker. Subclasses build that
+    state in _start(); _ensure_started() runs it the first time it is
+    called in each process, so nothing starts until it is used and a
+    forked worker gets its own.
+    """
+
+    _pid = None
+
+    @property
+    def started(self):
+        """Whether _start() has run in this process."""
+        return self._pid == os.getpid()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with _start_lock:
+            if self._pid == os.getpid():
+                return
+            self._start()
+            self._pid = os.getpid()
+
+    def _start(self):
+        raise NotImplementedError
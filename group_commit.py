@@ -0,0 +1,142 @@
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from forksafe import ForkSafe
+
+
+class _Job:
+    __slots__ = ('fn', 'future', 'enqueued_at')
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class GroupCommitWriter(ForkSafe):
+    """Funnel a process's writes through one thread that commits them in groups.
+
+    submit(fn) queues fn(db); the writer thread collects jobs until it has
+    max_batch of them or max_delay seconds have passed since the first, runs
+    each inside its own SAVEPOINT of a single transaction, commits once and
+    then hands every caller its own result (or exception). With context
+    (e.g. app.app_context) the writer thread runs inside it, so jobs can
+    use the same app services as the request that queued them.
+    """
+
+    def __init__(self, pool, max_batch=32, max_delay=0.005, timeout=10, context=None):
+        self.pool = pool
+        self.context = context or nullcontext
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+    def _start(self):
+        self._queue = queue.Queue()
+        self._latencies = deque(maxlen=1000)  # Seconds, most recent jobs
+        self._started_at = time.monotonic()
+        self.jobs = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn):
+        """Run fn(db) in the next group commit and return its result."""
+        self._ensure_started()
+        job = _Job(fn)
+        self._queue.put(job)
+        try:
+            return job.future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise sqlite3.OperationalError("group commit timed out")
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        with self.context():
+            while True:
+                batch = self._collect()
+                try:
+                    db = self.pool.acquire()
+                except sqlite3.Error as e:
+                    for job in batch:
+                        job.future.set_exception(e)
+                    continue
+                try:
+                    self._commit(db, batch)
+                finally:
+                    self.pool.release(db)
+
+    def _commit(self, db, batch):
+        outcomes = []
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            for job in batch:
+                # A failing job only undoes its own changes
+                db.execute("SAVEPOINT job")
+                try:
+                    outcomes.append((job, job.fn(db), None))
+                    db.execute("RELEASE job")
+                except Exception as e:
+                    db.execute("ROLLBACK TO job")
+                    db.execute("RELEASE job")
+                    outcomes.append((job, None, e))
+            db.execute("COMMIT")
+        except Exception as e:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            self.failed_batches += 1
+            for job in batch:
+                job.future.set_exception(e)
+            return
+
+        # Acknowledge only once the whole group is durable
+        done = time.perf_counter()
+        self.batches += 1
+        self.jobs += len(batch)
+        for job, result, error in outcomes:
+            self._latencies.append(done - job.enqueued_at)
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+    def stats(self):
+        if not self.started:
+            return {"running": False}
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 2)
+
+        uptime = time.monotonic() - self._started_at
+        return {
+            "running": True,
+            "queued": self._queue.qsize(),
+            "jobs": self.jobs,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "mean_batch_size": round(self.jobs / self.batches, 2) if self.batches else None,
+            "jobs_per_second": round(self.jobs / uptime, 2) if uptime else None,
+            "latency_p50_ms": percentile(0.50),
+            "latency_p99_ms": percentile(0.99),
+        }
@@ -0,0 +1,154 @@
+import os
+import shutil
+import struct
+import threading
+import time
+
+WAL_HEADER_BYTES = 32
+WAL_FRAME_HEADER_BYTES = 24
+
+# Worst state wins; 'fail' means this worker can't serve, 'degraded' that it
+# can but something needs attention
+STATES = ('ok', 'degraded', 'fail')
+
+
+def _worst(states):
+    return max(states, key=STATES.index, default='ok')
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+class HealthCheck:
+    """Readiness checks behind /health, cached so frequent probes are cheap.
+
+    run() returns the last report while it is younger than ttl seconds;
+    otherwise one caller re-runs the checks while concurrent probes keep
+    getting the previous report instead of queueing behind it.
+    """
+
+    def __init__(self, pool, database, disk_path, limiter=None, latencies=None, ttl=2.0,
+                 db_slow_ms=100, wal_max_bytes=64 * 1024 * 1024, wal_max_lag=10000,
+                 min_free_bytes=200 * 1024 * 1024, p99_max_ms=1000, maintenance=None):
+        self.pool = pool
+        self.database = database
+        self.disk_path = disk_path
+        self.limiter = limiter
+        self.latencies = latencies  # Recent request durations in seconds
+        self.ttl = ttl
+        self.db_slow_ms = db_slow_ms
+        self.wal_max_bytes = wal_max_bytes
+        self.wal_max_lag = wal_max_lag
+        self.min_free_bytes = min_free_bytes
+        self.p99_max_ms = p99_max_ms
+        self.maintenance = maintenance  # For its last checkpoint, if this worker ran one
+        self._lock = threading.Lock()
+        self._report = None
+        self._checked_at = 0.0
+
+    def run(self):
+        if self._report is not None and time.monotonic() - self._checked_at < self.ttl:
+            return self._report
+        if not self._lock.acquire(blocking=self._report is None):
+            return self._report
+        try:
+            if time.monotonic() - self._checked_at >= self.ttl:
+                self._report = self._check()
+                self._checked_at = time.monotonic()
+            return self._report
+        finally:
+            self._lock.release()
+
+    def _check(self):
+        checks = {}
+        for name, check in (
+            ('database', self._check_database),
+            ('wal', self._check_wal),
+            ('disk', self._check_disk),
+            ('limiter', self._check_limiter),
+            ('latency', self._check_latency),
+        ):
+            try:
+                checks[name] = check()
+            except Exception as e:
+                checks[name] = {"status": 'fail', "error": str(e)}
+        return {
+            "status": _worst(check['status'] for check in checks.values()),
+            "checked_at": round(time.time(), 3),
+            "checks": checks,
+        }
+
+    def _check_database(self):
+        start = time.perf_counter()
+        db = self.pool.acquire()
+        try:
+            db.execute("SELECT 1").fetchone()
+        finally:
+            self.pool.release(db)
+        elapsed = (time.perf_counter() - start) * 1000
+        return {
+            "status": 'degraded' if elapsed > self.db_slow_ms else 'ok',
+            "latency_ms": round(elapsed, 2),
+        }
+
+    def _check_wal(self):
+        # Read-only: the -wal file's size and header. Any checkpoint here would
+        # do write I/O on every probe and get in the way of maintenance.py's.
+        # SQLite reuses the file from the start after a checkpoint and only a
+        # TRUNCATE checkpoint shrinks it, so frames counts what has piled up
+        # since maintenance last truncated it.
+        try:
+            with open(self.database + '-wal', 'rb') as f:
+                header = f.read(WAL_HEADER_BYTES)
+                size = os.fstat(f.fileno()).st_size
+        except FileNotFoundError:
+            header, size = b'', 0
+        frames = 0
+        if len(header) == WAL_HEADER_BYTES:
+            page_size = struct.unpack('>I', header[8:12])[0]
+            if page_size == 1:
+                page_size = 65536  # How the header stores 64KB pages
+            if page_size:
+                frames = (size - WAL_HEADER_BYTES) // (page_size + WAL_FRAME_HEADER_BYTES)
+        status = 'ok'
+        if size > self.wal_max_bytes or frames > self.wal_max_lag:
+            status = 'degraded'
+        report = {"status": status, "size_bytes": size, "frames": frames}
+        last = getattr(self.maintenance, 'last_checkpoint', None)
+        if last is not None:
+            report['last_checkpoint'] = last
+        return report
+
+    def _check_disk(self):
+        free = shutil.disk_usage(self.disk_path).free
+        if free < self.min_free_bytes // 10:
+            status = 'fail'
+        elif free < self.min_free_bytes:
+            status = 'degraded'
+        else:
+            status = 'ok'
+        return {"status": status, "free_bytes": free}
+
+    def _check_limiter(self):
+        if self.limiter is None or not self.limiter.enabled:
+            return {"status": 'ok', "enabled": False}
+        # Unreachable storage doesn't stop pages from being served, but
+        # every rate-limited route will error until it's back
+        reachable = bool(self.limiter.storage.check())
+        return {"status": 'ok' if reachable else 'degraded', "enabled": True, "reachable": reachable}
+
+    def _check_latency(self):
+        samples = list(self.latencies or ())
+        p99 = percentile(samples, 0.99)
+        if p99 is None:
+            return {"status": 'ok', "samples": 0, "p99_ms": None}
+        p99 *= 1000
+        return {
+            "status": 'degraded' if p99 > self.p99_max_ms else 'ok',
+            "samples": len(samples),
+            "p99_ms": round(p99, 2),
+        }
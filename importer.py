@@ -0,0 +1,135 @@
+import os
+import zipfile
+from datetime import datetime, timezone
+
+from db import make_preview
+from stats import record_change, word_count
+
+IMPORT_EXTENSIONS = {'.md', '.markdown', '.txt'}
+IMPORT_BATCH_SIZE = 200  # Rows per executemany/transaction
+
+
+def _timestamp(dt):
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S') if dt else None
+
+
+def iter_upload(files, mtimes=None):
+    """Yield (name, read, created_at) for every candidate file in an upload.
+
+    files are werkzeug FileStorage objects: plain .md/.txt files (e.g. from a
+    folder picker) or .zip archives, which are expanded member by member.
+    read(limit) returns at most limit + 1 bytes so oversized files are caught
+    without loading them whole. mtimes optionally holds each file's original
+    modification time in ms (File.lastModified in the browser).
+    """
+    mtimes = mtimes or []
+    for index, upload in enumerate(files):
+        name = upload.filename or f"file-{index + 1}"
+        if name.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(upload.stream)
+            except zipfile.BadZipFile:
+                yield name, None, None
+                continue
+            with archive:
+                for info in archive.infolist():
+                    if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                        continue
+                    created = datetime(*info.date_time).replace(tzinfo=timezone.utc)
+                    yield (
+                        f"{name}/{info.filename}",
+                        lambda limit, info=info, archive=archive: _read_member(archive, info, limit),
+                        _timestamp(created),
+                    )
+        else:
+            created = None
+            if index < len(mtimes) and isinstance(mtimes[index], (int, float)):
+                created = datetime.fromtimestamp(mtimes[index] / 1000, timezone.utc)
+            yield name, lambda limit, upload=upload: upload.stream.read(limit + 1), _timestamp(created)
+
+
+def _read_member(archive, info, limit):
+    # Trust neither the declared size nor the compression ratio
+    if info.file_size > limit:
+        return b'\0' * (limit + 1)
+    with archive.open(info) as member:
+        return member.read(limit + 1)
+
+
+def decode_entry(name, read, max_chars):
+    """Return (content, None) for an importable file, or (None, reason)."""
+    if read is None:
+        return None, "not a valid ZIP archive"
+    if os.path.splitext(name)[1].lower() not in IMPORT_EXTENSIONS:
+        return None, "skipped: only .md and .txt files are imported"
+
+    max_bytes = max_chars * 4  # Worst case UTF-8
+    data = read(max_bytes)
+    if len(data) > max_bytes:
+        return None, f"longer than {max_chars} characters"
+    try:
+        content = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return None, "not UTF-8 text"
+
+    content = content.replace('\r\n', '\n')
+    if not content.strip():
+        return None, "empty file"
+    if len(content) > max_chars:
+        return None, f"longer than {max_chars} characters"
+    return content, None
+
+
+def import_posts(db, user_id, entries, max_chars, ip_address=None, batch_size=IMPORT_BATCH_SIZE, compress=None):
+    """Validate and insert uploaded files as posts, one transaction per batch.
+
+    compress, if given, turns content into what is stored (ContentCodec.compress).
+    Returns one {"name", "status", "message"} dict per file, in upload order.
+    """
+    results = []
+    batch = []
+    batch_results = []
+    batch_words = {}  # day -> [posts, words], for the writing stats
+
+    def flush():
+        if not batch:
+            return
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                """INSERT INTO post (user_id, content, preview, created_at, ip_address)
+                   VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)""",
+                batch
+            )
+            for day, (posts, words) in batch_words.items():
+                record_change(db, user_id, day, posts=posts, words=words)
+            db.execute("COMMIT")
+            for result in batch_results:
+                result['status'] = 'imported'
+        except Exception as e:
+            db.execute("ROLLBACK")
+            for result in batch_results:
+                result['status'] = 'error'
+                result['message'] = f"database error: {e}"
+        batch.clear()
+        batch_results.clear()
+        batch_words.clear()
+
+    for name, read, created_at in entries:
+        content, reason = decode_entry(name, read, max_chars)
+        result = {"name": name, "status": None, "message": reason}
+        results.append(result)
+        if content is None:
+            result['status'] = 'skipped'
+            continue
+        stored = compress(content) if compress else content
+        batch.append((user_id, stored, make_preview(content), created_at, ip_address))
+        batch_results.append(result)
+        day = (created_at or _timestamp(datetime.now(timezone.utc)))[:10]
+        totals = batch_words.setdefault(day, [0, 0])
+        totals[0] += 1
+        totals[1] += word_count(content)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return results
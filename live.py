@@ -0,0 +1,278 @@
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urlsplit
+
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie
+
+from app import apply_draft_patch, create_app, user_db
+from forksafe import ForkSafe
+
+LIVE_PATH = '/live'
+BODY_SPOOL_BYTES = 1024 * 1024  # Larger request bodies (imports) go to a temp file
+
+# WebSocket close codes (4000-4999 are the application's own)
+CLOSE_SESSION_EXPIRED = 4401
+CLOSE_FORBIDDEN = 4403
+
+
+def _environ(scope, body):
+    """PEP 3333 environ for an ASGI HTTP scope."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + name
+        value = value.decode('latin-1')
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+def _headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+
+class LiveApp(ForkSafe):
+    """ASGI front for the Flask app: ordinary requests, plus /live WebSockets.
+
+    Requests are handed to the WSGI app on a pool of http_threads, so every
+    view behaves exactly as under gunicorn. /live connections are plain
+    coroutines instead: an open editor tab costs a socket and a few KB, not
+    a thread. Over it the editor sends draft patches and gets each save
+    acknowledged, and is warned warning_seconds before its session expires.
+    The SQLite work behind a message runs on db_threads, inside an app
+    context, so the same helpers (and user_db()) serve both paths.
+    """
+
+    def __init__(self, app, http_threads=16, db_threads=4, warning_seconds=300, max_messages_per_minute=120):
+        self.app = app
+        self.http_threads = http_threads
+        self.db_threads = db_threads
+        self.warning_seconds = warning_seconds
+        self.max_messages_per_minute = max_messages_per_minute
+        self.connections = 0
+
+    def _start(self):
+        # Thread pools are per process; a worker forked after create_asgi_app() makes its own
+        self._http = ThreadPoolExecutor(self.http_threads, thread_name_prefix='flowrite-http')
+        self._db = ThreadPoolExecutor(self.db_threads, thread_name_prefix='flowrite-db')
+        self.connections = 0
+
+    async def __call__(self, scope, receive, send):
+        self._ensure_started()
+        if scope['type'] == 'http':
+            await self._http_request(scope, receive, send)
+        elif scope['type'] == 'websocket':
+            if scope['path'] == LIVE_PATH:
+                await self._live(scope, receive, send)
+            else:
+                await send({'type': 'websocket.close', 'code': 1000})
+        elif scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self._http.shutdown(wait=True)
+                self._db.shutdown(wait=True)
+                self.app.extensions['db_pool'].close()
+                self.app.extensions['shards'].close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # Plain HTTP: the WSGI app on a thread
+
+    async def _http_request(self, scope, receive, send):
+        with SpooledTemporaryFile(max_size=BODY_SPOOL_BYTES) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            loop = asyncio.get_running_loop()
+
+            def send_sync(message):
+                asyncio.run_coroutine_threadsafe(send(message), loop).result()
+            await loop.run_in_executor(self._http, self._run_wsgi, _environ(scope, body), send_sync)
+
+    def _run_wsgi(self, environ, send):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        def send_start():
+            if not response.get('sent'):
+                send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+                response['sent'] = True
+
+        result = self.app(environ, start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    send_start()  # Not before the first chunk: the app may still swap in an error page
+                    send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_start()
+            send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    # /live
+
+    def _session(self, headers):
+        """(session dict, expiry as a time.time()) from the request's cookie, or (None, None)."""
+        cookie = parse_cookie(headers.get('cookie', '')).get(self.app.config['SESSION_COOKIE_NAME'])
+        serializer = self.app.session_interface.get_signing_serializer(self.app)
+        if not cookie or serializer is None:
+            return None, None
+        lifetime = self.app.permanent_session_lifetime.total_seconds()
+        try:
+            data, signed_at = serializer.loads(cookie, max_age=lifetime, return_timestamp=True)
+        except BadSignature:
+            return None, None
+        return data, signed_at.timestamp() + lifetime
+
+    def _db_call(self, fn, user_id, *args):
+        with self.app.app_context():
+            with user_db(user_id) as db:
+                return fn(db, user_id, *args)
+
+    async def run_db(self, fn, user_id, *args):
+        """Await fn(db, user_id, *args) on the user's database, in the DB thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._db, self._db_call, fn, user_id, *args)
+
+    async def _live(self, scope, receive, send):
+        if (await receive())['type'] != 'websocket.connect':
+            return
+        headers = _headers(scope)
+        # Browsers send cookies with cross-site WebSocket handshakes; only our own pages may connect
+        origin = headers.get('origin')
+        if origin is not None and urlsplit(origin).netloc != headers.get('host'):
+            await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+            return
+        session, expires = self._session(headers)
+        await send({'type': 'websocket.accept'})
+        if not session or 'user_id' not in session:
+            # Accepted first, so the page sees why and stops reconnecting
+            await send({'type': 'websocket.close', 'code': CLOSE_SESSION_EXPIRED})
+            return
+        self._count_connection(1)
+        try:
+            await self._serve(session['user_id'], expires, receive, send)
+        finally:
+            self._count_connection(-1)
+
+    async def _serve(self, user_id, expires, receive, send):
+        async def reply(message):
+            await send({'type': 'websocket.send', 'text': json.dumps(message)})
+
+        await reply({"type": "hello", "expires_in": int(expires - time.time())})
+        warned = False
+        window_start, window_count = time.monotonic(), 0
+        while True:
+            now = time.time()
+            if now >= expires:
+                # The cookie can't be renewed over the socket; the page renews it and reconnects
+                await send({'type': 'websocket.close', 'code': CLOSE_SESSION_EXPIRED})
+                return
+            warn_at = expires - self.warning_seconds
+            if not warned and now >= warn_at:
+                await reply({"type": "session", "expires_in": int(expires - now)})
+                warned = True
+            try:
+                message = await asyncio.wait_for(receive(), timeout=(expires if warned else warn_at) - now)
+            except asyncio.TimeoutError:
+                continue
+            if message['type'] == 'websocket.disconnect':
+                return
+
+            if time.monotonic() - window_start > 60:
+                window_start, window_count = time.monotonic(), 0
+            window_count += 1
+            try:
+                request = json.loads(message.get('text') or message.get('bytes') or '')
+            except ValueError:
+                request = None
+            if not isinstance(request, dict):
+                await reply({"type": "error", "error": "Invalid message"})
+                continue
+            if window_count > self.max_messages_per_minute:
+                self._count_message(request.get('type'), 429)
+                await reply({"type": "ack", "id": request.get('id'), "status": 429, "error": "Too many messages"})
+                continue
+            await reply(await self._handle(user_id, expires, request))
+
+    async def _handle(self, user_id, expires, request):
+        kind = request.get('type')
+        if kind == 'ping':
+            self._count_message(kind, 200)
+            return {"type": "pong", "expires_in": int(expires - time.time())}
+        if kind == 'patch':
+            draft_id = request.get('draft')
+            if not isinstance(draft_id, int):
+                body, status = {"error": "draft is required"}, 400
+            else:
+                body, status = await self.run_db(
+                    apply_draft_patch, user_id, draft_id, request.get('version'), request.get('patches', [])
+                )
+            self._count_message(kind, status)
+            return dict(body, type="ack", id=request.get('id'), status=status)
+        self._count_message('unknown', 400)
+        return {"type": "error", "id": request.get('id'), "error": f"Unknown message type {kind!r}"}
+
+    def _count_connection(self, delta):
+        self.connections += delta  # Only ever changed on the event loop thread
+        self.app.extensions['metrics'].set('flowrite_live_connections', {}, self.connections)
+
+    def _count_message(self, kind, status):
+        self.app.extensions['metrics'].inc('flowrite_live_messages_total', {"type": kind, "status": str(status)})
+
+
+def create_asgi_app(config_name=None):
+    """The Flask app from create_app(), served through LiveApp. See pa_asgi.py."""
+    app = create_app(config_name)
+    live = LiveApp(
+        app,
+        http_threads=app.config['LIVE_HTTP_THREADS'],
+        db_threads=app.config['LIVE_DB_THREADS'],
+        warning_seconds=app.config['LIVE_SESSION_WARNING_SECONDS'],
+        max_messages_per_minute=app.config['LIVE_MAX_MESSAGES_PER_MINUTE'],
+    )
+    app.extensions['live'] = live
+    app.jinja_env.globals['live_path'] = LIVE_PATH  # The editor connects when this is set
+    return live
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every worker may run maintenance
+    fcntl = None
+
+from forksafe import ForkSafe
+
+
+class Maintenance(ForkSafe):
+    """Routine SQLite upkeep: WAL checkpoints, planner statistics, free-page reclaim.
+
+    run() does each task only when it is worth doing: a TRUNCATE checkpoint
+    once the -wal file passes wal_threshold bytes, ANALYZE once the post
+    table has grown or shrunk by analyze_ratio since the last one (plus the
+    always-cheap PRAGMA optimize), and incremental_vacuum in steps of
+    vacuum_step pages so writers get the database back between steps.
+    start() runs it every interval seconds on a background thread; a lock
+    file keeps workers from doing it at the same time.
+    """
+
+    def __init__(self, pool, database, logger, wal_threshold=32 * 1024 * 1024, analyze_ratio=0.2,
+                 analysis_limit=1000, vacuum_step=256, vacuum_max_steps=40, busy_timeout=2000, interval=300):
+        self.pool = pool
+        self.database = database
+        self.logger = logger
+        self.wal_threshold = wal_threshold
+        self.analyze_ratio = analyze_ratio
+        self.analysis_limit = analysis_limit
+        self.vacuum_step = vacuum_step
+        self.vacuum_max_steps = vacuum_max_steps
+        self.busy_timeout = busy_timeout
+        self.interval = interval
+        self.last_checkpoint = None  # The latest _checkpoint() in this process, for /health
+
+    def start(self):
+        """Run maintenance every interval seconds in this process (once per worker)."""
+        self._ensure_started()
+
+    def _start(self):
+        threading.Thread(target=self._loop, name='db-maintenance', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run(exclusive=True)
+            except Exception as e:
+                self.logger.error(f"Database maintenance failed: {e}")
+
+    def run(self, force=False, exclusive=False):
+        """Do whatever upkeep is due (everything, with force) and log the timings.
+
+        With exclusive, return None straight away if another process holds
+        the maintenance lock.
+        """
+        lock = self._lock_file() if exclusive else None
+        if exclusive and lock is False:
+            return None
+        db = self.pool.acquire()
+        try:
+            # Don't queue behind long transactions for as long as requests would
+            previous_timeout = db.execute("PRAGMA busy_timeout").fetchone()[0]
+            db.execute(f"PRAGMA busy_timeout = {self.busy_timeout}")
+            try:
+                report = {
+                    "analyze": self._analyze(db, force),
+                    "vacuum": self._vacuum(db),
+                    "checkpoint": self._checkpoint(db, force),  # Last: vacuum steps grow the WAL
+                }
+            finally:
+                db.execute(f"PRAGMA busy_timeout = {previous_timeout}")
+        finally:
+            self.pool.release(db)
+            if lock:
+                lock.close()
+        self.logger.info("Database maintenance: " + "; ".join(
+            f"{task} {details}" for task, details in report.items()
+        ))
+        return report
+
+    def _lock_file(self):
+        if fcntl is None:
+            return None
+        lock = open(self.database + '.maintenance.lock', 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        return lock  # Closing it releases the lock
+
+    def _wal_size(self):
+        try:
+            return os.path.getsize(self.database + '-wal')
+        except FileNotFoundError:
+            return 0
+
+    def _checkpoint(self, db, force):
+        size = self._wal_size()
+        if not force and size < self.wal_threshold:
+            return {"skipped": True, "wal_bytes": size}
+        start = time.perf_counter()
+        busy, frames, checkpointed = db.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        self.last_checkpoint = {
+            "at": round(time.time(), 3),
+            "frames": max(frames, 0),
+            "lag": max(frames - checkpointed, 0) if frames >= 0 else 0,  # Left behind by readers
+            "busy": bool(busy),
+        }
+        return {
+            "skipped": False,
+            "wal_bytes": size,
+            "wal_bytes_after": self._wal_size(),
+            "busy": bool(busy),  # A reader kept it from finishing; retried next run
+            "ms": _ms(start),
+        }
+
+    def _analyze(self, db, force):
+        start = time.perf_counter()
+        rows = db.execute("SELECT count(*) FROM post").fetchone()[0]
+        analyzed = None
+        has_stats = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+        ).fetchone()
+        if has_stats:
+            stat = db.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = 'post' LIMIT 1").fetchone()
+            analyzed = int(stat[0].split()[0]) if stat else None
+
+        if force or analyzed is None or abs(rows - analyzed) > max(analyzed * self.analyze_ratio, 100):
+            # analysis_limit samples each index instead of scanning it whole
+            db.execute(f"PRAGMA analysis_limit = {self.analysis_limit}")
+            db.execute("ANALYZE")
+            return {"ran": "ANALYZE", "rows": rows, "rows_at_last_analyze": analyzed, "ms": _ms(start)}
+        db.execute("PRAGMA optimize")
+        return {"ran": "optimize", "rows": rows, "rows_at_last_analyze": analyzed, "ms": _ms(start)}
+
+    def _vacuum(self, db):
+        if db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return {"skipped": True, "reason": "auto_vacuum is not INCREMENTAL (run db-maintenance --vacuum once)"}
+        start = time.perf_counter()
+        free_before = db.execute("PRAGMA freelist_count").fetchone()[0]
+        steps = 0
+        while steps < self.vacuum_max_steps and db.execute("PRAGMA freelist_count").fetchone()[0]:
+            # execute() only steps the pragma once, which frees a single page
+            db.executescript(f"PRAGMA incremental_vacuum({self.vacuum_step})")
+            steps += 1
+        free_after = db.execute("PRAGMA freelist_count").fetchone()[0]
+        return {"pages_freed": free_before - free_after, "pages_left": free_after, "steps": steps, "ms": _ms(start)}
+
+    def vacuum_full(self):
+        """One-off VACUUM that also switches an older database to incremental auto_vacuum.
+
+        Rewrites the whole file and blocks writers while it runs.
+        """
+        db = self.pool.acquire()
+        try:
+            start = time.perf_counter()
+            db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            db.execute("VACUUM")
+            report = {"auto_vacuum": db.execute("PRAGMA auto_vacuum").fetchone()[0], "ms": _ms(start)}
+        finally:
+            self.pool.release(db)
+        self.logger.info(f"Database VACUUM: {report}")
+        return report
+
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
@@ -0,0 +1,309 @@
+import atexit
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: dead workers' files are only recognised by age
+    fcntl = None
+
+from forksafe import ForkSafe
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RETIRED = 'retired.json'  # Counters and histograms of workers that have exited
+STALE_FLUSHES = 6  # Without fcntl (Windows): a worker file this many flush intervals old belongs to a dead process
+
+# name -> (type, help); every metric the app records must be listed here
+METRICS = {
+    'flowrite_requests_total': ('counter', 'HTTP requests by route, method and status.'),
+    'flowrite_request_duration_seconds': ('histogram', 'Time to handle a request.'),
+    'flowrite_db_queries_total': ('counter', 'SQL statements run on behalf of requests.'),
+    'flowrite_request_db_seconds': ('histogram', 'Time spent in SQLite per request.'),
+    'flowrite_template_render_seconds': ('histogram', 'Jinja template render time.'),
+    'flowrite_ratelimit_rejections_total': ('counter', 'Requests refused by the rate limiter.'),
+    'flowrite_password_check_seconds': ('histogram', 'Time to verify a password hash at login.'),
+    'flowrite_password_queue_seconds': ('histogram', 'Time password hashing jobs waited for a hashing thread.'),
+    'flowrite_password_queue_depth': ('gauge', 'Password hashing jobs queued or running.'),
+    'flowrite_content_compress_seconds': ('histogram', 'Time to compress a post body on write.'),
+    'flowrite_content_decompress_seconds': ('histogram', 'Time to decompress a post body on read.'),
+    'flowrite_content_bytes_total': ('counter', 'Post body bytes before (raw) and after (stored) compression.'),
+    'flowrite_markdown_render_seconds': ('histogram', 'Time to render a post or preview from markdown (cache misses only).'),
+    'flowrite_live_connections': ('gauge', 'Open /live editor connections (ASGI mode).'),
+    'flowrite_live_messages_total': ('counter', '/live messages handled, by type and resulting status.'),
+    'flowrite_password_rejections_total': ('counter', 'Logins and sign-ups refused because hashing was saturated.'),
+}
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection that counts and times the statements run through it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.query_count = 0
+        self.query_time = 0.0
+
+    def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        finally:
+            self.query_count += 1
+            self.query_time += time.perf_counter() - start
+
+    def executemany(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().executemany(*args, **kwargs)
+        finally:
+            self.query_count += 1
+            self.query_time += time.perf_counter() - start
+
+
+class Metrics(ForkSafe):
+    """In-process counters and histograms, shared across workers through files.
+
+    Recording only touches a dict under a lock. A background thread writes
+    this process's totals to <directory>/<pid>.json every flush_interval
+    seconds; render() adds up every worker's file into one Prometheus text
+    page, so any worker can answer a scrape.
+
+    When a worker goes (exit, crash, or a file that stopped being flushed),
+    its counters and histograms are folded into RETIRED, so totals never go
+    backwards, and its gauges are dropped.
+    """
+
+    def __init__(self, directory, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+
+    def _start(self):
+        # Fresh state in every (forked) worker
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        os.makedirs(self.directory, exist_ok=True)
+        # Left by an earlier process that had this pid
+        self._retire([self._path(os.getpid())], check=False)
+        self._exited = False
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+        atexit.register(self._exit, os.getpid())
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def inc(self, name, labels, value=1):
+        self._ensure_started()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, labels, value):
+        self._ensure_started()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, labels, seconds):
+        self._ensure_started()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # One slot per bucket plus +Inf, then sum and count
+                histogram = self._histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[index] += 1
+                    break
+            else:
+                histogram[len(BUCKETS)] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                "counters": [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, dict(labels), value] for (name, labels), value in self._gauges.items()],
+                "histograms": [[name, dict(labels), list(values)] for (name, labels), values in self._histograms.items()],
+            }
+
+    def flush(self):
+        if not self.started or self._exited:
+            return
+        _write_json(self._path(os.getpid()), self._snapshot())
+
+    def _exit(self, pid):
+        # atexit handlers are inherited across fork; only the process that registered this one retires its file
+        if self.started and pid == os.getpid():
+            try:
+                self.flush()
+                self._exited = True  # The flush thread mustn't bring the file back
+                self._retire([self._path(pid)], check=False)
+            except OSError:
+                pass
+
+    def _dead(self, path):
+        """Whether a worker file's process has gone.
+
+        A live worker can go quiet for a while (a long request holding the
+        GIL, a stopped process), and retiring its file would count its
+        totals twice once it flushes again, so age only decides where the
+        pid can't be checked.
+        """
+        try:
+            pid = int(os.path.basename(path)[:-len('.json')])
+        except ValueError:
+            return False
+        if pid == os.getpid():
+            return False
+        if fcntl is None:
+            try:
+                return time.time() - os.path.getmtime(path) > STALE_FLUSHES * self.flush_interval
+            except OSError:
+                return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass  # Alive, under another user
+        return False
+
+    def _retire(self, paths, check=True):
+        """Fold worker files into RETIRED (counters and histograms only) and delete them.
+
+        With check, files whose worker turns out to be alive (after waiting
+        for the lock) are left alone.
+        """
+        lock = None
+        if fcntl is not None:
+            # Workers collecting at the same moment must not fold the same file twice
+            lock = open(os.path.join(self.directory, RETIRED + '.lock'), 'w')
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if check:
+                paths = [path for path in paths if self._dead(path)]
+            snapshots = []
+            for path in paths:
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        snapshots.append(json.load(f))
+                except FileNotFoundError:
+                    continue  # Retired by someone else meanwhile
+                except (OSError, ValueError):
+                    snapshots.append(None)  # Unreadable: dropped
+            if not snapshots:
+                return
+            retired_path = os.path.join(self.directory, RETIRED)
+            try:
+                with open(retired_path, 'r', encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError):
+                snapshots.append(None)
+            counters, histograms = _sum([snapshot for snapshot in snapshots if snapshot is not None])
+            _write_json(retired_path, {
+                "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+                "histograms": [[name, dict(labels), values] for (name, labels), values in histograms.items()],
+            })
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        finally:
+            if lock is not None:
+                lock.close()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def collect(self):
+        """Sum every worker's latest totals (this worker's live, the rest from disk)."""
+        self._ensure_started()
+        self.flush()
+        paths = glob.glob(os.path.join(self.directory, '*.json'))
+        dead = [path for path in paths if os.path.basename(path) != RETIRED and self._dead(path)]
+        if dead:
+            self._retire(dead)
+            paths = glob.glob(os.path.join(self.directory, '*.json'))
+        snapshots = []
+        for path in paths:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return _sum(snapshots, gauges=True)
+
+    def render(self):
+        """All metrics in Prometheus text exposition format."""
+        counters, histograms = self.collect()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind in ('counter', 'gauge'):
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+            else:
+                for (metric, labels), values in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + ('+Inf',), values):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {values[-2]}")
+                    lines.append(f"{name}_count{_labels(labels)} {values[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+def _write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)  # Readers never see a half-written file
+
+
+def _sum(snapshots, gauges=False):
+    """Add up snapshots into ({(name, labels): value}, {(name, labels): [bucket counts, sum, count]})."""
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        # Gauges are summed too: per-worker depths add up to the site's
+        for name, labels, value in snapshot['counters'] + (snapshot.get('gauges', []) if gauges else []):
+            key = (name, tuple(sorted(dict(labels).items())))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(sorted(dict(labels).items())))
+            total = histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                total[index] += value
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
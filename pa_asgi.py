@@ -0,0 +1,17 @@
+import os
+import sys
+
+# Add your project directory to the sys.path
+project_home = '/home/sathvikpn/flowrite'
+if project_home not in sys.path:
+    sys.path.insert(0, project_home)
+
+# Set environment variables
+os.environ['FLASK_ENV'] = 'production'
+
+# Build the ASGI app: the same Flask app, plus /live connections for the editor.
+# Serve it with an ASGI server, e.g.
+#   uvicorn pa_asgi:application --workers 4
+#   gunicorn -k uvicorn.workers.UvicornWorker -w 4 pa_asgi:application
+from live import create_asgi_app
+application = create_asgi_app()
@@ -10,5 +10,6 @@ if project_home not in sys.path:
 os.environ['FLASK_ENV'] = 'production'
 os.environ['SECRET_KEY'] = 'your-secret-key-here'  # Replace with your actual secret key
 
-# Import your Flask app
-from app import app as application  # PythonAnywhere looks for 'application' 
\ No newline at end of file
+# Build your Flask app
+from app import create_app
+application = create_app()  # PythonAnywhere looks for 'application'
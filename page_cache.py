@@ -0,0 +1,59 @@
+import threading
+from collections import OrderedDict
+
+
+class PageCache:
+    """Byte-bounded LRU of rendered pages, keyed by (user_id, path).
+
+    Every entry remembers the ETag it was rendered for and get() only
+    returns it for the same ETag, so a page changed by another worker is
+    never served stale; invalidate_user() just frees this worker's copies
+    early. max_bytes=0 turns the cache off.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (user_id, path) -> (etag, body)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, path, etag):
+        if not self.max_bytes:
+            return None
+        with self._lock:
+            entry = self._entries.get((user_id, path))
+            if entry is None or entry[0] != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((user_id, path))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, path, etag, body):
+        if not self.max_bytes or len(body) > self.max_bytes // 4:
+            return
+        with self._lock:
+            old = self._entries.pop((user_id, path), None)
+            if old is not None:
+                self.size -= len(old[1])
+            self._entries[(user_id, path)] = (etag, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                self.size -= len(self._entries.pop(key)[1])
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
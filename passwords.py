@@ -0,0 +1,99 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from forksafe import ForkSafe
+
+
+class HasherBusy(Exception):
+    """Too many password hashes queued; the caller should answer 503 and retry later."""
+
+
+class PasswordHasher(ForkSafe):
+    """Runs pbkdf2 hashing on a few dedicated threads per worker.
+
+    hashlib releases the GIL while it hashes, so request threads waiting
+    here don't hold up the rest of the worker, and at most `threads` hashes
+    burn CPU at once. Once max_queue jobs are queued or running, new ones
+    are refused straight away with HasherBusy instead of piling up.
+    """
+
+    def __init__(self, iterations=1_000_000, threads=2, max_queue=16, timeout=10, metrics=None):
+        self.method = f"pbkdf2:sha256:{iterations}"
+        self.threads = threads
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.metrics = metrics
+
+    def _start(self):
+        self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix='password-hash')
+        self._lock = threading.Lock()
+        self._depth = 0
+        self.rejected = 0
+
+    def _publish_depth(self, depth):
+        # Outside the lock; the metrics registry takes its own
+        if self.metrics is not None:
+            self.metrics.set('flowrite_password_queue_depth', {}, depth)
+
+    def _set_depth(self, change):
+        with self._lock:
+            self._depth += change
+            depth = self._depth
+        self._publish_depth(depth)
+
+    def _run(self, fn, *args):
+        self._ensure_started()
+        # Check and claim a slot together, or concurrent callers could all
+        # pass the check before any of them counts
+        with self._lock:
+            busy = self._depth >= self.max_queue
+            if busy:
+                self.rejected += 1
+            else:
+                self._depth += 1
+                depth = self._depth
+        if busy:
+            if self.metrics is not None:
+                self.metrics.inc('flowrite_password_rejections_total', {})
+            raise HasherBusy()
+        self._publish_depth(depth)
+        enqueued = time.perf_counter()
+
+        def job():
+            if self.metrics is not None:
+                self.metrics.observe('flowrite_password_queue_seconds', {}, time.perf_counter() - enqueued)
+            try:
+                return fn(*args)
+            finally:
+                self._set_depth(-1)
+
+        future = self._executor.submit(job)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HasherBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored, password):
+        return self._run(check_password_hash, stored, password)
+
+    def needs_rehash(self, stored):
+        """True if stored was made with another method or cost than the configured one."""
+        return stored.split('$', 1)[0] != self.method
+
+    def stats(self):
+        if not self.started:
+            return {"running": False}
+        return {
+            "running": True,
+            "method": self.method,
+            "threads": self.threads,
+            "depth": self._depth,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
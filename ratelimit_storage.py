@@ -0,0 +1,176 @@
+import os
+import sqlite3
+import threading
+import time
+
+from limits.storage import MovingWindowSupport, Storage
+
+from forksafe import ForkSafe
+
+RATELIMIT_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS window_event (
+           key TEXT NOT NULL,
+           at REAL NOT NULL,
+           expires REAL NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_window_event_key_at ON window_event (key, at)",
+    "CREATE INDEX IF NOT EXISTS idx_window_event_expires ON window_event (expires)",
+    """CREATE TABLE IF NOT EXISTS counter (
+           key TEXT PRIMARY KEY,
+           count INTEGER NOT NULL,
+           expires REAL NOT NULL
+       ) WITHOUT ROWID""",
+]
+
+
+class SQLiteStorage(ForkSafe, Storage, MovingWindowSupport):
+    """Flask-Limiter storage in a local SQLite file, shared by every worker on the box.
+
+    RATELIMIT_STORAGE_URI = "sqlite://" + absolute path, e.g.
+    sqlite:///home/me/flowrite/instance/ratelimit.db. Moving-window
+    entries are one row each; acquire_entry() counts and inserts inside a
+    BEGIN IMMEDIATE transaction, so workers can't both take the last slot.
+    Expired rows are deleted at most every cleanup_interval seconds per
+    worker, cleanup_batch rows at a time. The data is disposable, so the
+    file runs with synchronous=OFF.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri, wrap_exceptions=False, cleanup_interval=10, cleanup_batch=1000, **options):
+        self.path = uri.split('://', 1)[1]
+        self.cleanup_interval = float(cleanup_interval)
+        self.cleanup_batch = int(cleanup_batch)
+        self._next_cleanup = 0.0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _start(self):
+        # One connection per thread, and none carried over a fork
+        self._local = threading.local()
+
+    def _db(self):
+        self._ensure_started()
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            db = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=OFF")
+            for statement in RATELIMIT_SCHEMA:
+                db.execute(statement)
+            self._local.db = db
+        return db
+
+    def _transaction(self, fn):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(db)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        self._cleanup(db)
+        return result
+
+    def _cleanup(self, db):
+        now = time.time()
+        if now < self._next_cleanup:
+            return
+        self._next_cleanup = now + self.cleanup_interval
+        # Small batches keep the write lock short; leftovers go next time
+        db.execute(
+            "DELETE FROM window_event WHERE rowid IN (SELECT rowid FROM window_event WHERE expires <= ? LIMIT ?)",
+            (now, self.cleanup_batch)
+        )
+        db.execute(
+            "DELETE FROM counter WHERE key IN (SELECT key FROM counter WHERE expires <= ? LIMIT ?)",
+            (now, self.cleanup_batch)
+        )
+
+    # Fixed-window strategies
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        def step(db):
+            now = time.time()
+            db.execute("DELETE FROM counter WHERE key = ? AND expires <= ?", (key, now))
+            return db.execute(
+                """INSERT INTO counter (key, count, expires) VALUES (?, ?, ?)
+                   ON CONFLICT (key) DO UPDATE SET
+                       count = count + excluded.count,
+                       expires = CASE WHEN ? THEN excluded.expires ELSE expires END
+                   RETURNING count""",
+                (key, amount, now + expiry, bool(elastic_expiry))
+            ).fetchone()[0]
+        return self._transaction(step)
+
+    def get(self, key):
+        row = self._db().execute(
+            "SELECT count FROM counter WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._db().execute("SELECT expires FROM counter WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else time.time()
+
+    def decr(self, key, amount=1):
+        def step(db):
+            row = db.execute(
+                "UPDATE counter SET count = max(count - ?, 0) WHERE key = ? AND expires > ? RETURNING count",
+                (amount, key, time.time())
+            ).fetchone()
+            return row[0] if row else 0
+        return self._transaction(step)
+
+    # Moving window
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+
+        def step(db):
+            now = time.time()
+            taken = db.execute(
+                "SELECT count(*) FROM window_event WHERE key = ? AND at > ?", (key, now - expiry)
+            ).fetchone()[0]
+            if taken + amount > limit:
+                return False
+            db.executemany(
+                "INSERT INTO window_event (key, at, expires) VALUES (?, ?, ?)",
+                [(key, now, now + expiry)] * amount
+            )
+            return True
+        return self._transaction(step)
+
+    def get_moving_window(self, key, limit, expiry):
+        now = time.time()
+        oldest, taken = self._db().execute(
+            "SELECT min(at), count(*) FROM window_event WHERE key = ? AND at > ?", (key, now - expiry)
+        ).fetchone()
+        return (oldest if oldest is not None else now), taken
+
+    # Housekeeping
+
+    def check(self):
+        try:
+            self._db().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        def step(db):
+            return (db.execute("DELETE FROM window_event").rowcount
+                    + db.execute("DELETE FROM counter").rowcount)
+        return self._transaction(step)
+
+    def clear(self, key):
+        def step(db):
+            db.execute("DELETE FROM window_event WHERE key = ?", (key,))
+            db.execute("DELETE FROM counter WHERE key = ?", (key,))
+        self._transaction(step)
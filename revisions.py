@@ -0,0 +1,110 @@
+import difflib
+import json
+import zlib
+
+SNAPSHOT_EVERY = 20  # Full copy every N revisions bounds how many rows a rebuild reads
+
+
+def _lines(text):
+    return text.splitlines(keepends=True)
+
+
+def make_delta(old, new):
+    """Line-level edit script turning old into new: [[i1, i2, replacement_lines], ...]."""
+    a, b = _lines(old), _lines(new)
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    return [
+        [i1, i2, b[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != 'equal'
+    ]
+
+
+def apply_delta(old, delta):
+    a = _lines(old)
+    out = []
+    pos = 0
+    for i1, i2, lines in delta:
+        out.extend(a[pos:i1])
+        out.extend(lines)
+        pos = i2
+    out.extend(a[pos:])
+    return ''.join(out)
+
+
+def _encode(kind, payload):
+    if kind == 'full':
+        raw = payload.encode('utf-8')
+    else:
+        raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return zlib.compress(raw)
+
+
+def _decode(kind, data):
+    raw = zlib.decompress(data).decode('utf-8')
+    return raw if kind == 'full' else json.loads(raw)
+
+
+def _insert(db, post_id, revision, kind, payload, length):
+    db.execute(
+        """INSERT INTO post_revision (post_id, revision, kind, data, length, created_at)
+           VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
+        (post_id, revision, kind, _encode(kind, payload), length)
+    )
+
+
+def record_revision(db, post_id, old_content, new_content):
+    """Append new_content to a post's history. Call inside the edit's transaction.
+
+    The first edit also stores the original text as revision 1, so posts that
+    are never edited cost nothing. Returns the new revision number.
+    """
+    latest = db.execute(
+        "SELECT MAX(revision) FROM post_revision WHERE post_id = ?", (post_id,)
+    ).fetchone()[0]
+    if latest is None:
+        _insert(db, post_id, 1, 'full', old_content, len(old_content))
+        latest = 1
+
+    revision = latest + 1
+    if (revision - 1) % SNAPSHOT_EVERY == 0:
+        _insert(db, post_id, revision, 'full', new_content, len(new_content))
+    else:
+        _insert(db, post_id, revision, 'delta', make_delta(old_content, new_content), len(new_content))
+    return revision
+
+
+def load_revision(db, post_id, revision):
+    """Rebuild the text of one revision from its nearest snapshot, or None if unknown."""
+    rows = db.execute(
+        """SELECT revision, kind, data FROM post_revision
+           WHERE post_id = ? AND revision <= ? AND revision >= (
+               SELECT MAX(revision) FROM post_revision
+               WHERE post_id = ? AND revision <= ? AND kind = 'full'
+           )
+           ORDER BY revision""",
+        (post_id, revision, post_id, revision)
+    ).fetchall()
+    if not rows or rows[-1]['revision'] != revision:
+        return None
+
+    text = None
+    for row in rows:
+        payload = _decode(row['kind'], row['data'])
+        text = payload if row['kind'] == 'full' else apply_delta(text, payload)
+    return text
+
+
+def list_revisions(db, post_id):
+    return db.execute(
+        """SELECT revision, kind, length, length(data) AS stored_bytes, created_at
+           FROM post_revision WHERE post_id = ? ORDER BY revision DESC""",
+        (post_id,)
+    ).fetchall()
+
+
+def diff_lines(old, new, old_label, new_label):
+    """Unified diff of two revisions as a list of lines for display."""
+    return list(difflib.unified_diff(
+        old.splitlines(), new.splitlines(), old_label, new_label, lineterm=''
+    ))
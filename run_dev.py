@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 import os
 import sys
-from app import app, init_db
+from app import create_app
 
 if __name__ == '__main__':
     # Set development environment
@@ -10,10 +10,8 @@ if __name__ == '__main__':
     # Parse command line arguments
     use_reloader = '--no-reload' not in sys.argv
     
-    # Initialize database if it doesn't exist
-    if not os.path.exists(app.config['DATABASE']):
-        print("Initializing development database...")
-        init_db()
+    # Creates (or migrates) the development database the first time
+    app = create_app('development')
     
     # Run development server
     app.run(
@@ -4,7 +4,9 @@ CREATE TABLE IF NOT EXISTS user (
     password TEXT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     last_login TIMESTAMP,
-    last_login_ip TEXT
+    last_login_ip TEXT,
+    post_version INTEGER NOT NULL DEFAULT 0,
+    shard INTEGER  -- Shard file holding this user's posts (SHARD_COUNT); NULL: this database
 );
 
 CREATE TABLE IF NOT EXISTS post (
@@ -14,5 +16,117 @@ CREATE TABLE IF NOT EXISTS post (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     ip_address TEXT,
     updated_at TIMESTAMP,
+    preview TEXT,
+    rendered_html TEXT,  -- Sanitized markdown rendering; NULL until first viewed (and after each edit)
     FOREIGN KEY(user_id) REFERENCES user(id)
 );
+
+-- Shelf listing reads only this index (keyset on created_at, id)
+CREATE INDEX IF NOT EXISTS idx_post_user_created
+    ON post (user_id, created_at DESC, id DESC, preview);
+
+-- Full-text search over post content (see search.SEARCH_SCHEMA).
+-- post.content is TEXT or a compressed BLOB; post_text() (registered by the
+-- connection pool) turns either into text. owner ('u' || user_id) scopes
+-- a search to one user's posts inside the index.
+CREATE VIEW IF NOT EXISTS post_body AS
+    SELECT id, post_text(content) AS content, 'u' || user_id AS owner FROM post;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(
+    content,
+    owner,
+    content='post_body',
+    content_rowid='id',
+    tokenize='porter unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS post_fts_insert AFTER INSERT ON post BEGIN
+    INSERT INTO post_fts (rowid, content, owner) VALUES (new.id, post_text(new.content), 'u' || new.user_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS post_fts_delete AFTER DELETE ON post BEGIN
+    INSERT INTO post_fts (post_fts, rowid, content, owner)
+    SELECT 'delete', old.id, post_text(old.content), 'u' || old.user_id
+    WHERE EXISTS (SELECT 1 FROM post_fts_docsize WHERE id = old.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS post_fts_update AFTER UPDATE OF content ON post
+WHEN post_text(old.content) IS NOT post_text(new.content) BEGIN
+    INSERT INTO post_fts (post_fts, rowid, content, owner)
+    SELECT 'delete', old.id, post_text(old.content), 'u' || old.user_id
+    WHERE EXISTS (SELECT 1 FROM post_fts_docsize WHERE id = old.id);
+    INSERT INTO post_fts (rowid, content, owner) VALUES (new.id, post_text(new.content), 'u' || new.user_id);
+END;
+
+-- Autosaved editor state, separate from published posts
+CREATE TABLE IF NOT EXISTS draft (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    post_id INTEGER,
+    content TEXT NOT NULL DEFAULT '',
+    version INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY(user_id) REFERENCES user(id),
+    FOREIGN KEY(post_id) REFERENCES post(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_draft_user_post ON draft (user_id, post_id);
+
+-- Edit history: kind is 'full' (zlib text) or 'delta' (zlib JSON line edits)
+CREATE TABLE IF NOT EXISTS post_revision (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id INTEGER NOT NULL,
+    revision INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    data BLOB NOT NULL,
+    length INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(post_id, revision),
+    FOREIGN KEY(post_id) REFERENCES post(id) ON DELETE CASCADE
+);
+
+-- Bumped on any change to a user's posts; part of the shelf/post ETags
+CREATE TRIGGER IF NOT EXISTS post_version_insert AFTER INSERT ON post BEGIN
+    UPDATE user SET post_version = post_version + 1 WHERE id = new.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS post_version_update AFTER UPDATE OF content ON post BEGIN
+    UPDATE user SET post_version = post_version + 1 WHERE id = new.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS post_version_delete AFTER DELETE ON post BEGIN
+    UPDATE user SET post_version = post_version + 1 WHERE id = old.user_id;
+END;
+
+-- Shared compression dictionaries (compression.py); never changed once stored
+CREATE TABLE IF NOT EXISTS content_dict (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    codec TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Writing stats (stats.py), kept up to date by deltas from each save, edit and delete
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY,
+    posts INTEGER NOT NULL DEFAULT 0,
+    words INTEGER NOT NULL DEFAULT 0,
+    active_days INTEGER NOT NULL DEFAULT 0,
+    streak INTEGER NOT NULL DEFAULT 0,      -- Consecutive days ending on streak_end
+    streak_end TEXT,                        -- Latest day with a post (UTC)
+    longest_streak INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY(user_id) REFERENCES user(id)
+);
+
+-- One row per user per day with posts (by created_at, UTC)
+CREATE TABLE IF NOT EXISTS user_daily_stats (
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    posts INTEGER NOT NULL,
+    words INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+
+-- Keep in step with db.SCHEMA_VERSION
+PRAGMA user_version = 11;
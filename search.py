@@ -0,0 +1,119 @@
+from markupsafe import Markup, escape
+
+# External-content FTS5 index over post text, kept in sync by triggers.
+# post.content may be compressed (compression.py), so the index reads the
+# post_body view, which decompresses through post_text(); every connection
+# that touches post needs that function (the pool registers it).
+# The update/delete triggers only remove rows that are actually indexed
+# (post_fts_docsize has one row per indexed document) so posts that predate
+# the index are safe to edit or delete before the backfill has reached them.
+# Compressing a post in place leaves its text alone, so that skips the index.
+# The owner column holds one token per user (owner_token()); searches match
+# it along with the words, so FTS only visits that user's documents instead
+# of every user's matches being joined to post and filtered afterwards.
+SEARCH_SCHEMA = [
+    """CREATE VIEW IF NOT EXISTS post_body AS
+        SELECT id, post_text(content) AS content, 'u' || user_id AS owner FROM post""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(
+        content,
+        owner,
+        content='post_body',
+        content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_insert AFTER INSERT ON post BEGIN
+        INSERT INTO post_fts (rowid, content, owner) VALUES (new.id, post_text(new.content), 'u' || new.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_delete AFTER DELETE ON post BEGIN
+        INSERT INTO post_fts (post_fts, rowid, content, owner)
+        SELECT 'delete', old.id, post_text(old.content), 'u' || old.user_id
+        WHERE EXISTS (SELECT 1 FROM post_fts_docsize WHERE id = old.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_update AFTER UPDATE OF content ON post
+    WHEN post_text(old.content) IS NOT post_text(new.content) BEGIN
+        INSERT INTO post_fts (post_fts, rowid, content, owner)
+        SELECT 'delete', old.id, post_text(old.content), 'u' || old.user_id
+        WHERE EXISTS (SELECT 1 FROM post_fts_docsize WHERE id = old.id);
+        INSERT INTO post_fts (rowid, content, owner) VALUES (new.id, post_text(new.content), 'u' || new.user_id);
+    END""",
+]
+
+# Control characters can't appear in a highlighted term, so they make safe
+# placeholders until the snippet has been HTML-escaped
+_MARK_OPEN, _MARK_CLOSE = '\x02', '\x03'
+
+
+def build_match_query(q):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix."""
+    terms = ['"' + term.replace('"', '""') + '"' for term in q.split()]
+    if not terms:
+        return None
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def owner_token(user_id):
+    """The post_fts owner value for a user's posts (as post_body computes it)."""
+    return f"u{user_id}"
+
+
+def highlight(snippet):
+    """Escape a raw snippet and turn the match placeholders into <mark> tags."""
+    html = str(escape(snippet))
+    return Markup(html.replace(_MARK_OPEN, '<mark>').replace(_MARK_CLOSE, '</mark>'))
+
+
+def search_posts(db, user_id, q, limit, offset=0):
+    """Best bm25 matches among one user's posts, with highlighted snippets."""
+    match = build_match_query(q)
+    if match is None:
+        return []
+    # The words only search content; owner matches every post of the user,
+    # so it carries no weight in the ranking
+    match = f'owner : "{owner_token(user_id)}" AND content : ({match})'
+    rows = db.execute(
+        """SELECT post.id, post.created_at,
+                  snippet(post_fts, 0, ?, ?, '…', 32) AS snippet
+           FROM post_fts JOIN post ON post.id = post_fts.rowid
+           WHERE post_fts MATCH ?
+           ORDER BY bm25(post_fts, 1.0, 0.0)
+           LIMIT ? OFFSET ?""",
+        (_MARK_OPEN, _MARK_CLOSE, match, limit, offset)
+    ).fetchall()
+    return [{
+        "id": row['id'],
+        "created_at": row['created_at'],
+        "snippet": highlight(row['snippet']),
+    } for row in rows]
+
+
+def backfill_search_index(db, batch_size=500):
+    """Index posts written before post_fts existed, one short transaction per batch.
+
+    Yields the running total after each batch so callers can report progress.
+    Safe to re-run: already indexed posts are skipped.
+    """
+    total = 0
+    last_id = 0
+    while True:
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute(
+                """SELECT id, post_text(content) AS content, user_id FROM post
+                   WHERE id > ? AND NOT EXISTS (SELECT 1 FROM post_fts_docsize WHERE id = post.id)
+                   ORDER BY id LIMIT ?""",
+                (last_id, batch_size)
+            ).fetchall()
+            db.executemany(
+                "INSERT INTO post_fts (rowid, content, owner) VALUES (?, ?, ?)",
+                [(row['id'], row['content'], owner_token(row['user_id'])) for row in rows]
+            )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        if not rows:
+            return
+        total += len(rows)
+        last_id = rows[-1]['id']
+        yield total
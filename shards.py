@@ -0,0 +1,135 @@
+import os
+import threading
+import zlib
+
+# Copied per user by split_user(), parents first: (table, rows belonging to the user)
+USER_TABLES = [
+    ('post', "user_id = ?"),
+    ('post_revision', "post_id IN (SELECT id FROM post WHERE user_id = ?)"),
+    ('draft', "user_id = ?"),
+    ('user_stats', "user_id = ?"),
+    ('user_daily_stats', "user_id = ?"),
+]
+
+
+def shard_path(database, number):
+    """instance/flowrite.db -> instance/flowrite.shard-3.db"""
+    stem, ext = os.path.splitext(database)
+    return f"{stem}.shard-{number}{ext}"
+
+
+def shard_of(user_id, count):
+    # crc32 rather than hash(): the same answer in every process and Python version
+    return zlib.crc32(str(user_id).encode('ascii')) % count
+
+
+class ShardRouter:
+    """Which SQLite file holds a user's posts.
+
+    With count=0 there's just DATABASE. Otherwise DATABASE is the catalog:
+    accounts, the user.shard mapping and compression dictionaries. Each of
+    the count shard files has the full schema, a stub user row for each of
+    its users (post_version, foreign keys) and all of their posts, drafts,
+    revisions, search index and stats, so writes by users on different
+    shards never wait on the same lock. A user whose shard is NULL (not
+    split yet) still lives in the catalog. The mapping only changes through
+    `flask split-shards`, which runs with the app stopped, so each process
+    caches it.
+    """
+
+    def __init__(self, database, count, make_pool, make_writer=None, make_maintenance=None):
+        self.database = database
+        self.count = count
+        self.paths = [shard_path(database, number) for number in range(count)]
+        self.pools = [make_pool(path) for path in self.paths]
+        self.writers = [make_writer(pool) for pool in self.pools] if make_writer else None
+        self.maintenance = [make_maintenance(pool, path) for pool, path in zip(self.pools, self.paths)] \
+            if make_maintenance else []
+        self._shards = {}  # user_id -> shard number or None
+        self._lock = threading.Lock()
+
+    def assign(self, user_id):
+        """Shard for a new user."""
+        return shard_of(user_id, self.count)
+
+    def lookup(self, user_id, catalog):
+        """user_id's shard (None: the catalog itself); catalog() gives a connection on a cache miss."""
+        if not self.count:
+            return None
+        try:
+            return self._shards[user_id]
+        except KeyError:
+            pass
+        row = catalog().execute("SELECT shard FROM user WHERE id = ?", (user_id,)).fetchone()
+        shard = row['shard'] if row is not None else None
+        if row is not None:
+            with self._lock:
+                self._shards[user_id] = shard
+        return shard
+
+    def remember(self, user_id, shard):
+        with self._lock:
+            self._shards[user_id] = shard
+
+    def close(self):
+        for pool in self.pools:
+            pool.close()
+
+
+def _copy_rows(source, target, table, where, user_id):
+    cursor = source.execute(f"SELECT * FROM {table} WHERE {where}", (user_id,))
+    columns = [column[0] for column in cursor.description]
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    copied = 0
+    while True:
+        rows = cursor.fetchmany(500)
+        if not rows:
+            return copied
+        target.executemany(statement, [tuple(row) for row in rows])
+        copied += len(rows)
+
+
+def _delete_user_rows(db, user_id):
+    # Revisions and post drafts go with their posts (ON DELETE CASCADE)
+    db.execute("DELETE FROM draft WHERE user_id = ?", (user_id,))
+    db.execute("DELETE FROM post WHERE user_id = ?", (user_id,))
+    db.execute("DELETE FROM user_stats WHERE user_id = ?", (user_id,))
+    db.execute("DELETE FROM user_daily_stats WHERE user_id = ?", (user_id,))
+
+
+def add_stub_user(db, user_id, username, post_version=0):
+    """The shard's copy of a user row: no password, never used to log in."""
+    db.execute(
+        "INSERT OR REPLACE INTO user (id, username, password, post_version) VALUES (?, ?, '', ?)",
+        (user_id, username, post_version)
+    )
+
+
+def split_user(catalog, shard_db, shard, user):
+    """Move one user's rows from the catalog to shard_db and point user.shard at it.
+
+    The shard side commits first and starts by clearing anything an
+    interrupted earlier run left there; the catalog only records the move
+    (and drops its copy) once that commit has landed, so re-running after
+    a crash simply redoes this user. Returns the number of posts moved.
+    """
+    shard_db.execute("BEGIN IMMEDIATE")
+    try:
+        _delete_user_rows(shard_db, user['id'])
+        # Above the catalog's post_version, so no ETag from before the move matches after it
+        add_stub_user(shard_db, user['id'], user['username'], user['post_version'] + 1)
+        counts = {table: _copy_rows(catalog, shard_db, table, where, user['id']) for table, where in USER_TABLES}
+        shard_db.execute("COMMIT")
+    except Exception:
+        shard_db.execute("ROLLBACK")
+        raise
+
+    catalog.execute("BEGIN IMMEDIATE")
+    try:
+        catalog.execute("UPDATE user SET shard = ? WHERE id = ?", (shard, user['id']))
+        _delete_user_rows(catalog, user['id'])
+        catalog.execute("COMMIT")
+    except Exception:
+        catalog.execute("ROLLBACK")
+        raise
+    return counts['post']
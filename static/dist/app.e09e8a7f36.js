@@ -0,0 +1,27 @@
+// Function to update the Indian time
+function updateIndianTime() {
+    const now = new Date();
+    const timeString = now.toLocaleTimeString('en-IN', { 
+        timeZone: 'Asia/Kolkata', hour: '2-digit', minute: '2-digit', second: "numeric", hour12: true 
+    }).replace(/am|pm/i, m => m.toUpperCase());
+    document.getElementById('indian-time').textContent = `${timeString} · Bengaluru`;
+}
+
+// Dynamically set main's padding-top based on navbar height
+function setMainPadding() {
+    var navbar = document.querySelector('.navbar.fixed-top');
+    var main = document.querySelector('main');
+    if (navbar && main) {
+        var navHeight = navbar.offsetHeight;
+        main.style.paddingTop = navHeight + 'px';
+    }
+}
+
+window.addEventListener('DOMContentLoaded', setMainPadding);
+window.addEventListener('resize', setMainPadding);
+
+// Call the function to display time immediately when the page loads
+updateIndianTime();
+
+// Update the time every second (1000 milliseconds)
+setInterval(updateIndianTime, 1000);
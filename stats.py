@@ -0,0 +1,174 @@
+from datetime import date, datetime, timedelta, timezone
+
+STATS_MONTHS = 12  # Months of daily rows the stats page reads
+
+STATS_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS user_stats (
+           user_id INTEGER PRIMARY KEY,
+           posts INTEGER NOT NULL DEFAULT 0,
+           words INTEGER NOT NULL DEFAULT 0,
+           active_days INTEGER NOT NULL DEFAULT 0,
+           streak INTEGER NOT NULL DEFAULT 0,
+           streak_end TEXT,
+           longest_streak INTEGER NOT NULL DEFAULT 0,
+           FOREIGN KEY(user_id) REFERENCES user(id)
+       )""",
+    """CREATE TABLE IF NOT EXISTS user_daily_stats (
+           user_id INTEGER NOT NULL,
+           day TEXT NOT NULL,
+           posts INTEGER NOT NULL,
+           words INTEGER NOT NULL,
+           PRIMARY KEY (user_id, day)
+       ) WITHOUT ROWID""",
+]
+
+
+def word_count(text):
+    return len(text.split()) if text else 0
+
+
+def _streaks(days):
+    """(length, last day) of the latest run of consecutive days, and the longest run."""
+    streak, end, longest, previous = 0, None, 0, None
+    for day in days:
+        current = date.fromisoformat(day)
+        streak = streak + 1 if previous is not None and current - previous == timedelta(days=1) else 1
+        longest = max(longest, streak)
+        end, previous = day, current
+    return streak, end, longest
+
+
+def _recount_streaks(db, user_id):
+    # Only the small rollup is read, never post bodies
+    days = [row[0] for row in db.execute(
+        "SELECT day FROM user_daily_stats WHERE user_id = ? ORDER BY day", (user_id,)
+    )]
+    streak, end, longest = _streaks(days)
+    db.execute(
+        "UPDATE user_stats SET active_days = ?, streak = ?, streak_end = ?, longest_streak = ? WHERE user_id = ?",
+        (len(days), streak, end, longest, user_id)
+    )
+
+
+def record_change(db, user_id, day, posts=0, words=0):
+    """Apply a post save/edit/delete to the user's totals and their day's rollup.
+
+    posts and words are deltas; day is the post's creation date
+    (YYYY-MM-DD, UTC like created_at). Runs inside the caller's write
+    transaction. Users without a user_stats row yet are left alone;
+    load() builds their row from scratch the first time it is needed.
+    """
+    updated = db.execute(
+        "UPDATE user_stats SET posts = posts + ?, words = words + ? WHERE user_id = ?",
+        (posts, words, user_id)
+    ).rowcount
+    if not updated:
+        return
+    day_posts = db.execute(
+        """INSERT INTO user_daily_stats (user_id, day, posts, words) VALUES (?, ?, ?, ?)
+           ON CONFLICT (user_id, day) DO UPDATE SET
+               posts = posts + excluded.posts,
+               words = words + excluded.words
+           RETURNING posts""",
+        (user_id, day, posts, words)
+    ).fetchone()[0]
+
+    if day_posts <= 0:
+        # Last post of that day went: the day no longer counts towards streaks
+        db.execute("DELETE FROM user_daily_stats WHERE user_id = ? AND day = ?", (user_id, day))
+        _recount_streaks(db, user_id)
+    elif posts > 0 and day_posts == posts:
+        # A day just became active; writing today after yesterday is the usual case
+        stats = db.execute(
+            "SELECT streak, streak_end, longest_streak FROM user_stats WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        previous = (date.fromisoformat(day) - timedelta(days=1)).isoformat()
+        if stats['streak_end'] is None or stats['streak_end'] < day:
+            streak = stats['streak'] + 1 if stats['streak_end'] == previous else 1
+            db.execute(
+                """UPDATE user_stats SET active_days = active_days + 1, streak = ?, streak_end = ?,
+                       longest_streak = max(longest_streak, ?)
+                   WHERE user_id = ?""",
+                (streak, day, streak, user_id)
+            )
+        else:
+            _recount_streaks(db, user_id)  # Backdated (imported) posts can join or split runs
+
+
+def rebuild_user(db, user_id, batch_size=500):
+    """Recompute one user's stats from their posts, streaming the bodies in batches.
+
+    Runs inside the caller's write transaction. Returns the number of posts read.
+    """
+    days = {}
+    cursor = db.execute(
+        "SELECT date(created_at) AS day, post_text(content) AS content FROM post WHERE user_id = ?",
+        (user_id,)
+    )
+    posts = 0
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            totals = days.setdefault(row['day'], [0, 0])
+            totals[0] += 1
+            totals[1] += word_count(row['content'])
+        posts += len(rows)
+
+    db.execute("DELETE FROM user_daily_stats WHERE user_id = ?", (user_id,))
+    db.executemany(
+        "INSERT INTO user_daily_stats (user_id, day, posts, words) VALUES (?, ?, ?, ?)",
+        [(user_id, day, p, w) for day, (p, w) in days.items()]
+    )
+    db.execute(
+        "INSERT OR REPLACE INTO user_stats (user_id, posts, words) VALUES (?, ?, ?)",
+        (user_id, posts, sum(w for _, w in days.values()))
+    )
+    _recount_streaks(db, user_id)
+    return posts
+
+
+def totals(db, user_id, today=None):
+    """A user's totals and streaks from their user_stats row (built first if missing)."""
+    row = db.execute("SELECT * FROM user_stats WHERE user_id = ?", (user_id,)).fetchone()
+    if row is None:
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rebuild_user(db, user_id)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        row = db.execute("SELECT * FROM user_stats WHERE user_id = ?", (user_id,)).fetchone()
+
+    # The stored streak ends on its last active day; it has lapsed if that was before yesterday
+    today = today or datetime.now(timezone.utc).date()  # Days are UTC, like created_at
+    yesterday = (today - timedelta(days=1)).isoformat()
+    return {
+        "posts": row['posts'],
+        "words": row['words'],
+        "average_words": round(row['words'] / row['posts']) if row['posts'] else 0,
+        "active_days": row['active_days'],
+        "current_streak": row['streak'] if row['streak_end'] and row['streak_end'] >= yesterday else 0,
+        "longest_streak": row['longest_streak'],
+        "last_active": row['streak_end'],
+    }
+
+
+def load(db, user_id, today=None):
+    """totals() plus posts and words per month, from STATS_MONTHS months of daily rows at most."""
+    today = today or datetime.now(timezone.utc).date()
+    result = totals(db, user_id, today)
+    first_month = today.year * 12 + today.month - STATS_MONTHS  # Months since year 0, zero-based
+    since = date(first_month // 12, first_month % 12 + 1, 1)
+    months = {}
+    for day in db.execute(
+        "SELECT day, posts, words FROM user_daily_stats WHERE user_id = ? AND day >= ? ORDER BY day",
+        (user_id, since.isoformat())
+    ):
+        month = months.setdefault(day['day'][:7], {"month": day['day'][:7], "posts": 0, "words": 0})
+        month['posts'] += day['posts']
+        month['words'] += day['words']
+    result['months'] = list(months.values())
+    return result